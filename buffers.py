@@ -0,0 +1,66 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Buffer helpers for the hot paths of the ciphers and GHASH
+# Buffers are processed as a whole instead of as lists of 16 byte copies:
+# XOR goes through a single integer (or a NumPy uint64 view when NumPy is installed),
+# blocks are read through memoryview slices and outputs are written into preallocated buffers
+
+# Below this length the integer XOR is faster than setting up the NumPy arrays
+NUMPY_THRESHOLD = 1024
+
+# XORs two buffers, the result has the length of the shorter one
+def xor(a, b) -> bytes:
+    length = min(len(a), len(b))
+    if np is not None and length >= NUMPY_THRESHOLD:
+        out = bytearray(length)
+        xor_into(out, a, b)
+        return bytes(out)
+
+    result = int.from_bytes(a[:length], byteorder='little') ^ int.from_bytes(b[:length], byteorder='little')
+    return result.to_bytes(length, byteorder='little')
+
+# Writes the XOR of two buffers into the preallocated output, which has to be writable and at least as long as the shorter one
+def xor_into(out, a, b):
+    length = min(len(a), len(b))
+    view = memoryview(out)[:length]
+
+    if np is not None and length >= NUMPY_THRESHOLD:
+        # Whole 64 bit words are XORed as uint64, the rest byte by byte
+        words = length // 8 * 8
+        np.bitwise_xor(np.frombuffer(a, dtype=np.uint64, count=words // 8),
+                       np.frombuffer(b, dtype=np.uint64, count=words // 8),
+                       out=np.frombuffer(view[:words], dtype=np.uint64))
+        for i in range(words, length):
+            view[i] = a[i] ^ b[i]
+        return
+
+    result = int.from_bytes(a[:length], byteorder='little') ^ int.from_bytes(b[:length], byteorder='little')
+    view[:] = result.to_bytes(length, byteorder='little')
+
+# XORs the same 16 byte block onto every block of the buffer
+def xor_repeat(data, block: bytes) -> bytes:
+    return xor(data, block * ((len(data) + 15) // 16))
+
+# Zero pads the buffer to a multiple of 16 bytes, a buffer that already is one is returned as is
+def pad_16(data):
+    remainder = len(data) % 16
+    if remainder == 0:
+        return data
+    return bytes(data) + bytes(16 - remainder)
+
+# Yields zero-copy views of the 16 byte blocks, the last one may be shorter
+def iter_blocks(buffer):
+    view = memoryview(buffer)
+    for i in range(0, len(view), 16):
+        yield view[i:i + 16]
+
+# Reads the zero padded blocks as big endian integers, as GHASH and the GCM field elements use them
+def block_ints(buffer) -> list[int]:
+    return [int.from_bytes(block, byteorder='big') for block in iter_blocks(pad_16(buffer))]
+
+# Copies the zero padded blocks out of the buffer, for types that keep their blocks as bytes
+def blocks(buffer) -> list[bytes]:
+    return [bytes(block) for block in iter_blocks(pad_16(buffer))]
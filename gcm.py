@@ -1,10 +1,18 @@
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-
+import hmac
+import mmap
+import os
+import struct
+import tempfile
 
 import sea128
-from gf.types import gf128
+from gf.ghash import ghash_engine, PARALLEL_THRESHOLD
+import buffers
 import helper
 
+# Chunk size of the file mode
+FILE_CHUNK_SIZE = 1 << 20
+
 def encrypt_aes128(key, data):
     cipher = Cipher(algorithms.AES(key), modes.ECB())
     encryptor = cipher.encryptor()
@@ -16,84 +24,246 @@ def encrypt_sea128(key, data):
     return sea128.encrypt(key, data)
 
 
+# Lays out the counter blocks start .. start + count - 1 for the nonce
+# The nonce is written once for all blocks, only the 32 bit counters, which wrap around, are packed into the buffer
+def counter_blocks(nonce: bytes, start: int, count: int) -> bytes:
+    blocks = bytearray((nonce + bytes(4)) * count)
+    for i in range(count):
+        struct.pack_into('>I', blocks, 16 * i + 12, (start + i) & 0xFFFFFFFF)
+    return bytes(blocks)
+
 # Encrypts the plaintext using CTR mode with the given cipher func
+# All counter blocks are encrypted with a single cipher call and XORed onto the plaintext at once
 def encrypt_ctr(key: bytes, nonce: bytes, plaintext: bytes, cipher_func) -> bytes:
 
-    blocks = helper.slice_blocks_16(plaintext)
+    # CTR in GCM starts at 2 due to H and Y0
+    keystream = cipher_func(key, counter_blocks(nonce, 2, (len(plaintext) + 15) // 16))
+
+    return buffers.xor(plaintext, keystream)
+
+
+# Calculates GHASH over AD and ciphertext, the auth key may be given as bytes or as prepared ghash_engine
+# With processes set, large ciphertexts are hashed in segments on several processes
+def ghash(ad: bytes, ciphertext: bytes, auth_key: bytes | ghash_engine, processes: int | None = None,
+          parallel_threshold: int = PARALLEL_THRESHOLD) -> tuple[bytes, bytes]:
+
+    if not isinstance(auth_key, ghash_engine):
+        auth_key = ghash_engine(auth_key)
+
+    return auth_key.digest(ad, ciphertext, processes, parallel_threshold)
+
+
+# Incremental GCM: the AD is passed with update_aad, the text in chunks of any size with update
+# GHASH state, counter and unused keystream are carried across chunks, only partial blocks are buffered
+# With processes set, chunks of at least parallel_threshold bytes are hashed in segments on several processes,
+# the worker processes are started on the first such chunk and kept until finalize
+class gcm_stream:
+    def __init__(self, key: bytes, nonce: bytes, cipher_func, decrypt: bool = False, processes: int | None = None,
+                 parallel_threshold: int = PARALLEL_THRESHOLD):
+        self.key = key
+        self.nonce = nonce
+        self.cipher_func = cipher_func
+        self.decrypt = decrypt
+        self.processes = processes
+        self.parallel_threshold = parallel_threshold
+
+        # Generate H (Auth key) and Y0
+        self.auth_key = cipher_func(key, b'\x00' * 16)
+        self.y0 = cipher_func(key, nonce + (1).to_bytes(4, byteorder='big'))
+        self.engine = ghash_engine(self.auth_key)
+
+        self.state = 0
+        self.ad_length = 0
+        self.text_length = 0
+        self.pending = b''      # Bytes of the current partial GHASH block
+        self.keystream = b''    # Keystream left over from the last chunk
+        self.counter = 2        # CTR in GCM starts at 2 due to H and Y0
+        self.ad_done = False
+        self.L = None
+        self.tag = None         # Set by finalize, the stream takes no more data after that
+
+    # Hashes all whole blocks of pending + data and keeps the rest for the next call
+    def absorb(self, data):
+        if self.pending:
+            fill = min(16 - len(self.pending), len(data))
+            self.pending += bytes(data[:fill])
+            data = data[fill:]
+            if len(self.pending) < 16:
+                return
+            self.state = self.engine.update(self.state, self.pending)
+
+        whole = len(data) // 16 * 16
+        if self.processes is not None and self.processes > 1 and whole >= self.parallel_threshold:
+            self.state = self.engine.update_parallel(self.state, data[:whole], self.processes)
+        else:
+            self.state = self.engine.update(self.state, data[:whole])
+        self.pending = bytes(data[whole:])
+
+    # The AD ends with a zero padded block, before the ciphertext starts
+    def finish_aad(self):
+        if not self.ad_done:
+            self.state = self.engine.update(self.state, self.pending)
+            self.pending = b''
+            self.ad_done = True
+
+    def check_open(self):
+        if self.tag is not None:
+            raise ValueError("Stream is already finalized")
+
+    def update_aad(self, data: bytes):
+        self.check_open()
+        if self.ad_done:
+            raise ValueError("AD has to be passed before the text")
+        self.ad_length += len(data)
+        self.absorb(memoryview(data))
+
+    # Encrypts or decrypts the next chunk
+    def update(self, data: bytes) -> bytes:
+        self.check_open()
+        self.finish_aad()
+        data = memoryview(data)
+
+        # Encrypt only the counter blocks that the leftover keystream does not cover
+        missing = len(data) - len(self.keystream)
+        if missing > 0:
+            count = (missing + 15) // 16
+            self.keystream += self.cipher_func(self.key, counter_blocks(self.nonce, self.counter, count))
+            self.counter += count
+
+        output = buffers.xor(data, self.keystream)
+        self.keystream = self.keystream[len(data):]
+
+        # GHASH always runs over the ciphertext
+        self.absorb(data if self.decrypt else output)
+        self.text_length += len(data)
+
+        return output
+
+    # Returns the tag, after this no more data can be passed and further calls return the same tag
+    def finalize(self) -> bytes:
+        if self.tag is not None:
+            return self.tag
+
+        self.finish_aad()
+        self.state = self.engine.update(self.state, self.pending)
+        self.pending = b''
+        self.engine.close_pool()
+
+        # Calculate bit lengths of AD and Ciphertext and convert to 64 bit big endian
+        self.L = (self.ad_length * 8).to_bytes(8, byteorder='big') + (self.text_length * 8).to_bytes(8, byteorder='big')
+        self.state = self.engine.update(self.state, self.L)
+
+        self.tag = buffers.xor(self.state.to_bytes(16, byteorder='big'), self.y0)
+        return self.tag
+
+    def verify(self, tag_given: bytes) -> bool:
+        return hmac.compare_digest(self.finalize(), tag_given)
+
+
+def encrypt_gcm(key: bytes, nonce: bytes, plaintext: bytes, ad: bytes, cipher_func,
+                processes: int | None = None) -> tuple[bytes, bytes, bytes, bytes]:
+
+    stream = gcm_stream(key, nonce, cipher_func, processes=processes)
+    stream.update_aad(ad)
+    ciphertext = stream.update(plaintext)
+    tag = stream.finalize()
+
+    return ciphertext, tag, stream.L, stream.auth_key
+
+def decrypt_gcm(key: bytes, nonce: bytes, ciphertext: bytes, ad: bytes, tag_given: bytes, cipher_func,
+                processes: int | None = None) -> tuple[bytes, bool]:
+
+    stream = gcm_stream(key, nonce, cipher_func, decrypt=True, processes=processes)
+    stream.update_aad(ad)
+    plaintext = stream.update(ciphertext)
+
+    return (plaintext, stream.verify(tag_given))
+
+
+# Reads the file in chunks, either through mmap or with plain reads of chunk_size bytes
+def read_chunks(file, chunk_size: int, use_mmap: bool):
+    if use_mmap and os.fstat(file.fileno()).st_size > 0:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                for i in range(0, len(view), chunk_size):
+                    # Release every chunk, the map can only be closed without views on it
+                    with view[i:i + chunk_size] as chunk:
+                        yield chunk
+        return
 
-    counter = 2 # CTR in GCM starts at 2 due to H and Y0
-    keystream_plain = nonce + counter.to_bytes(4, byteorder='big')
+    while chunk := file.read(chunk_size):
+        yield chunk
 
-    encrypted_blocks = []
-    for block in blocks:
-        keystream_plain = cipher_func(key, keystream_plain)     # Generate current block-key
-        encrypted_block = helper.xor_buf(block, keystream_plain)
-        encrypted_blocks.append(encrypted_block)
-        counter += 1
-        keystream_plain = nonce + counter.to_bytes(4, byteorder='big')
+# Runs the file through the stream and writes the output chunk by chunk, the memory use does not depend on the file size
+def process_file(stream: gcm_stream, in_path: str, out_path: str, ad: bytes, chunk_size: int, use_mmap: bool):
+    stream.update_aad(ad)
+    with open(in_path, 'rb') as in_file, open(out_path, 'wb') as out_file:
+        for chunk in read_chunks(in_file, chunk_size, use_mmap):
+            out_file.write(stream.update(chunk))
 
-    return helper.merge_blocks_16(encrypted_blocks)
+def encrypt_file(key: bytes, nonce: bytes, in_path: str, out_path: str, ad: bytes, cipher_func,
+                 chunk_size: int = FILE_CHUNK_SIZE, use_mmap: bool = False) -> tuple[bytes, bytes, bytes]:
 
+    stream = gcm_stream(key, nonce, cipher_func)
+    process_file(stream, in_path, out_path, ad, chunk_size, use_mmap)
+    tag = stream.finalize()
 
-def ghash(ad: bytes, ciphertext: bytes, auth_key: bytes) -> tuple[bytes, bytes]:
+    return tag, stream.L, stream.auth_key
 
-    hash = b'\x00' * 16
+# The plaintext is only known to be authentic at the end, the caller has to discard the output file if the tag does not match
+def decrypt_file(key: bytes, nonce: bytes, in_path: str, out_path: str, ad: bytes, tag_given: bytes, cipher_func,
+                 chunk_size: int = FILE_CHUNK_SIZE, use_mmap: bool = False) -> bool:
 
-    for ad_block in helper.slice_blocks_16(ad):
-        assoc_data = helper.pad_block_16(ad_block)
-        hash = helper.xor_buf(hash, assoc_data)
-        hash = (gf128.from_buf(hash) * gf128.from_buf(auth_key)).as_buf()
+    stream = gcm_stream(key, nonce, cipher_func, decrypt=True)
+    process_file(stream, in_path, out_path, ad, chunk_size, use_mmap)
 
-    # Apply Auth Key to each ciphertext block
-    for block in helper.slice_blocks_16(ciphertext):
-        padded_block = helper.pad_block_16(block)
-        hash = helper.xor_buf(hash, padded_block)
-        hash = (gf128.from_buf(hash) * gf128.from_buf(auth_key)).as_buf()
-    
-    # Calculate bit lengths of AD and Ciphertext and convert to 64 bit big endian
-    ad_bit_length = len(ad) * 8
-    ciphertext_bit_length = len(ciphertext) * 8
-    ad_len_buf = ad_bit_length.to_bytes(8, byteorder='big')
-    ciphertext_len_buf = ciphertext_bit_length.to_bytes(8, byteorder='big')
+    return stream.verify(tag_given)
 
-    # Concat to calculate L
-    L = ad_len_buf + ciphertext_len_buf
+# Streams AD and text in chunks of chunk_size bytes
+def encrypt_chunked(key: bytes, nonce: bytes, plaintext: bytes, ad: bytes, cipher_func, chunk_size: int, processes: int | None = None,
+                    parallel_threshold: int = PARALLEL_THRESHOLD) -> tuple[bytes, bytes, bytes, bytes]:
 
-    hash = helper.xor_buf(hash, L)
-    hash = (gf128.from_buf(hash) * gf128.from_buf(auth_key)).as_buf()
+    stream = gcm_stream(key, nonce, cipher_func, processes=processes, parallel_threshold=parallel_threshold)
+    for i in range(0, len(ad), chunk_size):
+        stream.update_aad(ad[i:i + chunk_size])
+    ciphertext = b''.join(stream.update(plaintext[i:i + chunk_size]) for i in range(0, len(plaintext), chunk_size))
 
-    return (hash, L)
+    return ciphertext, stream.finalize(), stream.L, stream.auth_key
 
+def decrypt_chunked(key: bytes, nonce: bytes, ciphertext: bytes, ad: bytes, tag_given: bytes, cipher_func, chunk_size: int,
+                    processes: int | None = None, parallel_threshold: int = PARALLEL_THRESHOLD) -> tuple[bytes, bool]:
 
-def encrypt_gcm(key: bytes, nonce: bytes, plaintext: bytes, ad: bytes, cipher_func) -> tuple[bytes, bytes, bytes, bytes]:
-    
-    # Generate H (Auth key) and Y0
-    auth_key = cipher_func(key, b'\x00' * 16)
+    stream = gcm_stream(key, nonce, cipher_func, decrypt=True, processes=processes, parallel_threshold=parallel_threshold)
+    for i in range(0, len(ad), chunk_size):
+        stream.update_aad(ad[i:i + chunk_size])
+    plaintext = b''.join(stream.update(ciphertext[i:i + chunk_size]) for i in range(0, len(ciphertext), chunk_size))
 
-    y0 = nonce + (1).to_bytes(4, byteorder='big')
-    y0 = cipher_func(key, y0)
+    return (plaintext, stream.verify(tag_given))
 
-    ciphertext = encrypt_ctr(key, nonce, plaintext, cipher_func)
+# Runs the text through encrypt_file in a temporary directory
+def encrypt_via_file(key: bytes, nonce: bytes, plaintext: bytes, ad: bytes, cipher_func, chunk_size: int,
+                     use_mmap: bool) -> tuple[bytes, bytes, bytes, bytes]:
 
-    hash, L = ghash(ad, ciphertext, auth_key)
-    tag = helper.xor_buf(hash, y0)
+    with tempfile.TemporaryDirectory() as directory:
+        in_path, out_path = os.path.join(directory, "in"), os.path.join(directory, "out")
+        with open(in_path, 'wb') as f:
+            f.write(plaintext)
 
-    return ciphertext, tag, L, auth_key
+        tag, L, auth_key = encrypt_file(key, nonce, in_path, out_path, ad, cipher_func, chunk_size, use_mmap)
+        with open(out_path, 'rb') as f:
+            return f.read(), tag, L, auth_key
 
-def decrypt_gcm(key: bytes, nonce: bytes, ciphertext: bytes, ad: bytes, tag_given: bytes, cipher_func) -> tuple[bytes, bool]:
+def decrypt_via_file(key: bytes, nonce: bytes, ciphertext: bytes, ad: bytes, tag_given: bytes, cipher_func, chunk_size: int,
+                     use_mmap: bool) -> tuple[bytes, bool]:
 
-    # Generate H (Auth key) and Y0
-    auth_key = cipher_func(key, b'\x00' * 16)
+    with tempfile.TemporaryDirectory() as directory:
+        in_path, out_path = os.path.join(directory, "in"), os.path.join(directory, "out")
+        with open(in_path, 'wb') as f:
+            f.write(ciphertext)
 
-    y0 = nonce + (1).to_bytes(4, byteorder='big')
-    y0 = cipher_func(key, y0)
-
-    hash, L = ghash(ad, ciphertext, auth_key)
-    plaintext = encrypt_ctr(key, nonce, ciphertext, cipher_func)
-
-    tag = helper.xor_buf(hash, y0)
-
-    return (plaintext, tag == tag_given)
+        authentic = decrypt_file(key, nonce, in_path, out_path, ad, tag_given, cipher_func, chunk_size, use_mmap)
+        with open(out_path, 'rb') as f:
+            return (f.read(), authentic)
 
 def exec_cipher(assignment):
 
@@ -105,15 +275,13 @@ def exec_cipher(assignment):
     key = helper.base64_to_buffer(arguments["key"])
     ad = helper.base64_to_buffer(arguments["ad"])
 
+    cipher_func = {"aes128": encrypt_aes128, "sea128": encrypt_sea128}[algorithm]
+
     if action == "gcm_encrypt":
 
         plaintext = helper.base64_to_buffer(arguments["plaintext"])
 
-        if algorithm == "aes128":
-            ciphertext, tag, L, auth_key = encrypt_gcm(key, nonce, plaintext, ad, encrypt_aes128)
-            
-        elif algorithm == "sea128":
-            ciphertext, tag, L, auth_key = encrypt_gcm(key, nonce, plaintext, ad, encrypt_sea128)
+        ciphertext, tag, L, auth_key = encrypt_gcm(key, nonce, plaintext, ad, cipher_func)
         
         return {
             "ciphertext": helper.buffer_to_base64(ciphertext), 
@@ -127,10 +295,53 @@ def exec_cipher(assignment):
         ciphertext = helper.base64_to_buffer(arguments["ciphertext"])
         tag = helper.base64_to_buffer(arguments["tag"])
 
-        if algorithm == "aes128":
-            plaintext, authentic = decrypt_gcm(key, nonce, ciphertext, ad, tag, encrypt_aes128)
-        elif algorithm == "sea128":
-            plaintext, authentic = decrypt_gcm(key, nonce, ciphertext, ad, tag, encrypt_sea128)
+        plaintext, authentic = decrypt_gcm(key, nonce, ciphertext, ad, tag, cipher_func)
+
+        return {"plaintext": helper.buffer_to_base64(plaintext), "authentic": authentic}
+
+# Test-only actions for the streaming paths, gcm_encrypt and gcm_decrypt stay in the assignment format
+# "chunk_size" streams AD and text in chunks, "file" runs them through encrypt_file/decrypt_file ("mmap" to map them)
+# "processes" hashes chunks of at least "parallel_threshold" bytes on several processes, a low threshold keeps the inputs small
+def exec_stream(assignment):
+
+    action = assignment["action"]
+    arguments = assignment["arguments"]
+
+    nonce = helper.base64_to_buffer(arguments["nonce"])
+    key = helper.base64_to_buffer(arguments["key"])
+    ad = helper.base64_to_buffer(arguments["ad"])
+
+    cipher_func = {"aes128": encrypt_aes128, "sea128": encrypt_sea128}[arguments["algorithm"]]
+    chunk_size = arguments.get("chunk_size", FILE_CHUNK_SIZE)
+    use_file = arguments.get("file", False)
+    use_mmap = arguments.get("mmap", False)
+    processes = arguments.get("processes")
+    parallel_threshold = arguments.get("parallel_threshold", PARALLEL_THRESHOLD)
+
+    if action == "gcm_stream_encrypt":
+
+        plaintext = helper.base64_to_buffer(arguments["plaintext"])
+
+        if use_file:
+            ciphertext, tag, L, auth_key = encrypt_via_file(key, nonce, plaintext, ad, cipher_func, chunk_size, use_mmap)
+        else:
+            ciphertext, tag, L, auth_key = encrypt_chunked(key, nonce, plaintext, ad, cipher_func, chunk_size, processes, parallel_threshold)
+
+        return {
+            "ciphertext": helper.buffer_to_base64(ciphertext),
+            "tag": helper.buffer_to_base64(tag),
+            "L": helper.buffer_to_base64(L),
+            "H": helper.buffer_to_base64(auth_key)
+            }
+
+    elif action == "gcm_stream_decrypt":
+
+        ciphertext = helper.base64_to_buffer(arguments["ciphertext"])
+        tag = helper.base64_to_buffer(arguments["tag"])
+
+        if use_file:
+            plaintext, authentic = decrypt_via_file(key, nonce, ciphertext, ad, tag, cipher_func, chunk_size, use_mmap)
+        else:
+            plaintext, authentic = decrypt_chunked(key, nonce, ciphertext, ad, tag, cipher_func, chunk_size, processes, parallel_threshold)
 
         return {"plaintext": helper.buffer_to_base64(plaintext), "authentic": authentic}
-    
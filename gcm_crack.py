@@ -1,5 +1,8 @@
 from gf.types import gfpoly, gf128
-from gf.functions import sff, ddf, edf
+from gf.functions import find_roots, gcd_poly
+from gf.ghash import ghash_engine
+from gf.vector import gf128_vector
+import buffers
 import gcm
 import helper
 
@@ -13,8 +16,8 @@ class gcm_msg:
 def build_ghash_poly(ad: bytes, ciphertext: bytes) -> gfpoly:
     
     # cut down input into padded 16-byte blocks
-    A_blocks = helper.slice_blocks_16(helper.pad_bytes_16(ad))
-    C_blocks = helper.slice_blocks_16(helper.pad_bytes_16(ciphertext))
+    A_blocks = buffers.blocks(ad)
+    C_blocks = buffers.blocks(ciphertext)
     
     # calculation of L taken from ghash function
     ad_bit_length = len(ad) * 8
@@ -57,71 +60,98 @@ def build_equation(m1: gcm_msg, m2: gcm_msg) -> gfpoly:
     return equation.make_monic()
 
 
-# This function will factorize the polynomial equation returning solutions for H
+# This function will find the roots of the polynomial equation returning solutions for H
+# Only the linear factors are of interest, so the higher degree parts are never factored
 def factorize(equation: gfpoly) -> list[gf128]:
-    
-    # run square-free factorization
-    sff_factors = sff(equation)
-    
-    factors = []
-    for factor, multiplicity in sff_factors:
-        # Further factor each factor
-        ddf_factors = ddf(factor)
-        for ddf_factor, degree in ddf_factors:
-            # run edf on factors with degree > 1
-            if ddf_factor.degree() > 1:
-                edf_factors = edf(ddf_factor, degree)
-                factors.extend(edf_factors)
-            else:
-                factors.append(ddf_factor)
-
-    # extract roots
-    candidates = []
-    for factor in factors:
-        # we only care about linear factors (X + c)
-        if factor.degree() == 1:
-            root = gf128.from_buf(factor.coeff()[0])
-            candidates.append(root)
-    
-    return candidates
-
-def get_mask_for_candidate(m: gcm_msg, candidate: gf128) -> bytes:
-    ghash_result, _ = gcm.ghash(m.ad, m.ciphertext, candidate.as_buf())
-    return helper.xor_buf(m.tag, ghash_result)
-
-
-# This function will find the auth key H and mask that was used to generate the tags for the messages m1, m2, m3
-def crack_auth_key(m1: gcm_msg, m2: gcm_msg, m3: gcm_msg) -> tuple[gf128, gf128]:
-    equation = build_equation(m1, m2)
-    # let it rip!
-    candidates = factorize(equation)
-
-    # use m3 to find the correct root
-    for candidate in candidates:
-        # Get the mask that gets xored at the end
-        mask = get_mask_for_candidate(m1, candidate)
-        # Calculate the tag for m3 with the candidate
-        ghash_result, _ = gcm.ghash(m3.ad, m3.ciphertext, candidate.as_buf())
-        potential_tag = helper.xor_buf(mask, ghash_result)
-        if potential_tag == m3.tag:
-            # Bingo!
+    return find_roots(equation)
+
+def get_mask_for_candidate(m: gcm_msg, engine: ghash_engine) -> bytes:
+    ghash_result, _ = engine.digest(m.ad, m.ciphertext)
+    return buffers.xor(m.tag, ghash_result)
+
+
+# Candidates are checked in chunks, so a match early in a long root list skips the rest
+CANDIDATE_CHUNK = 64
+
+# Evaluates the polynomial with Horner's method at all points at once, acc = acc * points + c_i
+def evaluate(coeffs: list[int], points: gf128_vector) -> gf128_vector:
+    value = gf128_vector([0] * len(points), points.use_numpy)
+    for coeff in reversed(coeffs):
+        value = value * points + coeff
+    return value
+
+# H is a root of the equation of every pair of messages, so their gcd keeps H while shrinking the degree
+# The equations of m1 with each message but the last are combined, the last message verifies the candidates
+# With enough messages the gcd usually is linear and its root is H without any factorization
+def narrow_equation(messages: list[gcm_msg]) -> gfpoly:
+    equation = None
+    for m in messages[1:-1]:
+        next_equation = build_equation(messages[0], m)
+
+        # Messages with the same content give no information
+        if next_equation.coeff() == [b'\x00' * 16]:
+            continue
+
+        equation = next_equation if equation is None else gcd_poly(equation, next_equation)
+        if equation.degree() <= 1:
+            break
+
+    return equation
+
+# This function will find the auth key H and mask that was used to generate the tags of the messages
+def crack_auth_key(messages: list[gcm_msg]) -> tuple[gf128, gf128]:
+    equation = narrow_equation(messages)
+    if equation is None:
+        raise ValueError("Messages do not differ, H can not be determined")
+
+    # H is a root of every equation, a constant gcd means the messages do not share one auth key
+    if equation.degree() < 1:
+        raise ValueError("Messages are inconsistent, their equations have no common root")
+
+    if equation.degree() == 1:
+        # Monic X + c has the single root c
+        candidates = [gf128.from_buf(equation.coeff()[0])]
+    else:
+        # let it rip!
+        candidates = factorize(equation)
+
+    # H is correct if it also solves the equation of m1 and the last message, Q = P_1 + P_N + T_1 + T_N
+    # Q is built once and evaluated at a whole chunk of candidates per Horner pass
+    check = build_equation(messages[0], messages[-1]).coeff_ints()
+    for start in range(0, len(candidates), CANDIDATE_CHUNK):
+        chunk = candidates[start:start + CANDIDATE_CHUNK]
+        values = evaluate(check, gf128_vector([candidate.int() for candidate in chunk])).to_ints()
+        if 0 in values:
+            # Bingo! Get the mask that gets xored at the end, the GHASH tables are only built for H
+            candidate = chunk[values.index(0)]
+            mask = get_mask_for_candidate(messages[0], ghash_engine(candidate.as_buf()))
             return candidate, gf128.from_buf(mask)
 
+    raise ValueError("No candidate for H verified against the last message")
+
+# Messages are given as m1, m2, ..., mN and/or as list under "messages", at least three are needed
+def read_messages(arguments: dict) -> list[gcm_msg]:
+    numbered = sorted((int(key[1:]), key) for key in arguments if key[0] == 'm' and key[1:].isdigit())
+    messages = [gcm_msg(arguments[key]) for _, key in numbered]
+    messages += [gcm_msg(m) for m in arguments.get('messages', [])]
+
+    if len(messages) < 3:
+        raise ValueError("At least three messages with the same nonce are needed")
+    return messages
+
 
 def exec_gcm_crack(assignment):
     arguments = assignment["arguments"]
 
-    m1 = gcm_msg(arguments['m1'])
-    m2 = gcm_msg(arguments['m2'])
-    m3 = gcm_msg(arguments['m3'])
-    
+    messages = read_messages(arguments)
+
     forgery_ciphertext = helper.base64_to_buffer(arguments['forgery']['ciphertext'])
     forgery_ad = helper.base64_to_buffer(arguments['forgery']['associated_data'])
 
-    H, mask = crack_auth_key(m1, m2, m3)
+    H, mask = crack_auth_key(messages)
 
     forged_tag, _ = gcm.ghash(forgery_ad, forgery_ciphertext, H.as_buf())
-    forged_tag = helper.xor_buf(forged_tag, mask.as_buf())
+    forged_tag = buffers.xor(forged_tag, mask.as_buf())
 
     return { 'tag': helper.buffer_to_base64(forged_tag), 'H': H.b64(), 'mask': mask.b64() }
 
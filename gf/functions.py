@@ -65,17 +65,46 @@ def sff(f: gfpoly) -> list[tuple[gfpoly, int]]:
 
     return z
 
+# Precomputes the rows X^(q * i) mod f for i < deg(f) with q = 2^128
+# The Frobenius map h -> h^q is linear over GF(q), since the coefficients satisfy a^q = a
+def frobenius_matrix(f: gfpoly) -> list[list[int]]:
+    n = f.degree()
+    x_q = gfpoly.X().powmod(2 ** 128, f)
+
+    rows = []
+    row = gfpoly.one()
+    for _ in range(n):
+        coeffs = row.coeff_ints()
+        rows.append(coeffs + [0] * (n - len(coeffs)))
+        row = (row * x_q).divmod(f)[1]
+
+    return rows
+
+# Calculates h^q mod f as the linear combination sum h_i * X^(q * i) of the matrix rows
+def apply_frobenius(h: gfpoly, matrix: list[list[int]]) -> gfpoly:
+    result = [0] * len(matrix)
+    for coeff, row in zip(h.coeff_ints(), matrix):
+        if coeff == 0:
+            continue
+        for j in range(len(row)):
+            result[j] ^= primi.gf128_mul_gcm(coeff, row[j])
+    return gfpoly.from_coeff_ints(result)
+
 # Distinct degree factorization
+# X^(q^d) mod f is carried from step to step with one Frobenius application
+# Factors of f* divide f, so the powers can stay reduced mod f while f* shrinks
 def ddf(f: gfpoly) -> list[tuple[gfpoly, int]]:
     z = []
     d = 1
     f_monic = gfpoly(f.coeff()).make_monic() # f*
+    matrix = frobenius_matrix(f_monic)
+    h_frob = gfpoly.X().divmod(f_monic)[1]  # X^{q^0} mod f
 
     # Bingo, let it rip
     while f_monic.degree() >= 2 * d:
-        # h = X^{2^{128d}} + X mod f*
-        h = gfpoly.X().powmod(2 ** (128 * d), f_monic)
-        h = h + gfpoly.X()
+        # h = X^{2^{128d}} + X mod f
+        h_frob = apply_frobenius(h_frob, matrix)
+        h = h_frob + gfpoly.X()
 
         # g = gcd(h, f*)
         g = gcd_poly(h, f_monic)
@@ -94,19 +123,33 @@ def ddf(f: gfpoly) -> list[tuple[gfpoly, int]]:
 
     return z
 
+# Trace map Tr(h) = h + h^2 + h^4 + ... + h^(2^(128d - 1)) mod f
+# Split into Tr_{q^d/q}(h) = sum of h^(q^i) for i < d with the Frobenius matrix, followed by 128 squarings
+def trace_map(h: gfpoly, f: gfpoly, d: int, matrix: list[list[int]]) -> gfpoly:
+    relative_trace = h
+    h_frob = h
+    for _ in range(d - 1):
+        h_frob = apply_frobenius(h_frob, matrix)
+        relative_trace += h_frob
+
+    trace = relative_trace
+    for _ in range(127):
+        relative_trace = relative_trace.square().divmod(f)[1]
+        trace += relative_trace
+
+    return trace
+
 # Equal degree factorization (Cantor-Zassenhaus)
+# In characteristic 2 the trace map sends every factor's residue to 0 or 1, so gcd(u, Tr(h)) splits u
 def edf(f: gfpoly, d: int) -> list[gfpoly]:
-    q = 2**128
     z = [f]
-    
+    matrix = frobenius_matrix(f) if d > 1 else []
+
     while any(u.degree() > d for u in z):
         h = gfpoly.random(f.degree() - 1)  # random poly with deg(h) < deg(f)
         
-        e = (q**d - 1) // 3
-        # h^e = h^[(q^d - 1) / 3]
-        h_pow_e = h.powmod(e, f)
-        # g = h^e - 1
-        g = h_pow_e + gfpoly.one()  
+        # g = Tr(h), one g is used to split all pending factors
+        g = trace_map(h, f, d, matrix)
         
         for u in z[:]:  # Iterate over a copy of z to avoid modifying the list while iterating
             if u.degree() > d:
@@ -119,4 +162,21 @@ def edf(f: gfpoly, d: int) -> list[gfpoly]:
                     z.append(j.make_monic())
                     quotient, _ = u.divmod(j)
                     z.append(quotient.make_monic())
-    return z
\ No newline at end of file
+    return z
+
+
+# Finds all roots of f in GF(2^128)
+# gcd(f, X^q - X) isolates the product of the distinct linear factors of f, only that part is split with edf
+def find_roots(f: gfpoly) -> list[gf128]:
+    f_monic = gfpoly(f.coeff()).make_monic()
+    if f_monic.degree() < 1:
+        return []
+
+    # h = X^q - X mod f*
+    h = gfpoly.X().powmod(2 ** 128, f_monic) + gfpoly.X()
+    linear_part = gcd_poly(h, f_monic)
+    if linear_part.degree() < 1:
+        return []
+
+    # Each monic linear factor X + c has the root c
+    return [gf128.from_buf(factor.coeff()[0]) for factor in edf(linear_part, 1)]
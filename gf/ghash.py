@@ -0,0 +1,156 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from gf.primitives import REDUCT_POLY_GCM, apply_linear_tables, build_linear_tables, gf128_mul_gcm, gf128_pow_gcm, lookup_linear_tables
+import buffers
+
+# Number of blocks that are aggregated into one step, larger tables stop fitting into the caches
+DEFAULT_AGGREGATE = 8
+
+# Inputs with fewer blocks are hashed with the plain Horner chain, the power tables would not pay off
+AGGREGATE_THRESHOLD = 64
+
+# Inputs with fewer bytes are not split across processes
+PARALLEL_THRESHOLD = 1 << 20
+
+# Builds 16 tables of 256 entries, one per byte position of a block, holding the product of every byte value with H.
+# Multiplication is linear, so value * H is the XOR of the table entries of each of its 16 bytes.
+def build_mul_tables(auth_key: bytes) -> list[list[int]]:
+
+    # H * x^i for i = 0..127, multiplying by x is a right shift in the reflected order
+    h_powers = []
+    value = int.from_bytes(auth_key, byteorder='big')
+    for _ in range(128):
+        h_powers.append(value)
+        value = (value >> 1) ^ REDUCT_POLY_GCM if value & 1 else value >> 1
+
+    return build_linear_tables(h_powers)
+
+# Engine of a worker process, its tables are built once when the worker starts and reused for every segment
+worker_engine = None
+
+def init_worker(auth_key: bytes, aggregate: int):
+    global worker_engine
+    worker_engine = ghash_engine(auth_key, aggregate)
+
+# Hashes a segment from a zero state in a worker process
+def hash_segment(segment: bytes) -> int:
+    return worker_engine.update(0, segment)
+
+# GHASH engine with precomputed multiplication tables for a single auth key
+# Each block is multiplied by H with 16 table lookups instead of a bit-serial multiplication
+# Long inputs are hashed k blocks per step with tables of H^1 .. H^k (aggregated reduction):
+#   state' = (state + B_1) * H^k + B_2 * H^(k-1) + ... + B_k * H
+# The table entries are already reduced products, so the k products are summed with XOR and the
+# blocks are looked up byte by byte without converting them to integers
+class ghash_engine:
+    def __init__(self, auth_key: bytes, aggregate: int = DEFAULT_AGGREGATE):
+        self.auth_key = auth_key
+        self.aggregate = aggregate
+        self.__tables = build_mul_tables(auth_key)
+        self.__power_tables = None
+        self.pool = None
+        self.workers = 0
+
+    # Multiplies a block given as big endian integer with H
+    def mul_h(self, value: int) -> int:
+        return apply_linear_tables(self.__tables, value)
+
+    # Tables of H^k for the state and of H^k .. H^1 for the bytes of a group of k blocks, built on first use
+    def power_tables(self) -> tuple[list[list[int]], list[list[int]]]:
+        if self.__power_tables is None:
+            h = int.from_bytes(self.auth_key, byteorder='big')
+            tables = [self.__tables]
+            power = h
+            for _ in range(self.aggregate - 1):
+                power = gf128_mul_gcm(power, h)
+                tables.append(build_mul_tables(power.to_bytes(16, byteorder='big')))
+
+            group_tables = []
+            for table in reversed(tables):
+                group_tables.extend(table)
+            self.__power_tables = (tables[-1], group_tables)
+
+        return self.__power_tables
+
+    # Absorbs the data into the hash state, the last block is zero padded
+    def update(self, state: int, data: bytes) -> int:
+        if self.aggregate > 1 and len(data) >= 16 * AGGREGATE_THRESHOLD:
+            return self.update_aggregated(state, data)
+
+        for value in buffers.block_ints(data):
+            state = self.mul_h(state ^ value)
+        return state
+
+    def update_aggregated(self, state: int, data: bytes) -> int:
+        state_tables, group_tables = self.power_tables()
+        data = bytes(buffers.pad_16(data))
+        size = 16 * self.aggregate
+        end = len(data) // size * size
+
+        for i in range(0, end, size):
+            state = apply_linear_tables(state_tables, state) ^ lookup_linear_tables(group_tables, data[i:i + size])
+
+        # Remaining blocks with the Horner chain
+        for value in buffers.block_ints(data[end:]):
+            state = self.mul_h(state ^ value)
+        return state
+
+    # Starts the worker processes, they stay up for all following update_parallel calls until close_pool
+    def open_pool(self, processes: int | None = None):
+        if self.pool is None:
+            self.workers = processes or os.cpu_count()
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                            initargs=(self.auth_key, self.aggregate))
+
+    def close_pool(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    # Splits the data into segments that are hashed in separate processes, the pool is opened on first use
+    # A segment hashed from a zero state is the sum of its blocks times H^(n - j + 1), so the results are
+    # combined like blocks: state' = state * H^n + segment_hash, with n the number of blocks of the segment
+    def update_parallel(self, state: int, data: bytes, processes: int | None = None) -> int:
+        data = buffers.pad_16(data)
+        blocks = len(data) // 16
+        if blocks == 0:
+            return state
+
+        self.open_pool(processes)
+        segment_blocks = (blocks + self.workers - 1) // self.workers
+
+        bounds = [(16 * start, 16 * min(start + segment_blocks, blocks)) for start in range(0, blocks, segment_blocks)]
+        futures = [self.pool.submit(hash_segment, bytes(data[begin:end])) for begin, end in bounds]
+
+        h = int.from_bytes(self.auth_key, byteorder='big')
+        for (begin, end), future in zip(bounds, futures):
+            state = gf128_mul_gcm(state, gf128_pow_gcm(h, (end - begin) // 16)) ^ future.result()
+
+        return state
+
+    # With processes set, ciphertexts of at least parallel_threshold bytes are hashed on several processes
+    # A pool that was opened for this digest is closed again, one opened by the caller stays up
+    def digest(self, ad: bytes, ciphertext: bytes, processes: int | None = None,
+               parallel_threshold: int = PARALLEL_THRESHOLD) -> tuple[bytes, bytes]:
+
+        state = self.update(0, ad)
+        if processes is not None and processes > 1 and len(ciphertext) >= parallel_threshold:
+            own_pool = self.pool is None
+            try:
+                state = self.update_parallel(state, ciphertext, processes)
+            finally:
+                if own_pool:
+                    self.close_pool()
+        else:
+            state = self.update(state, ciphertext)
+
+        # Calculate bit lengths of AD and Ciphertext and convert to 64 bit big endian
+        ad_len_buf = (len(ad) * 8).to_bytes(8, byteorder='big')
+        ciphertext_len_buf = (len(ciphertext) * 8).to_bytes(8, byteorder='big')
+
+        # Concat to calculate L
+        L = ad_len_buf + ciphertext_len_buf
+        state = self.update(state, L)
+
+        return (state.to_bytes(16, byteorder='big'), L)
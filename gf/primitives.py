@@ -25,33 +25,209 @@ def gf128_mul(a: int, b: int) -> int:
         b >>= 1  # Move to the next bit in b
     return result
 
-# Galois field multiplication for 128 bit GCM elements
+# GCM elements are kept in GCM's reflected bit order: the block is read as big endian integer,
+# so x^0 is the MSB and multiplying by x is a right shift reduced by 0xE1 || 0^120
+GCM_ONE = 1 << 127
+REDUCT_POLY_GCM = 0xE1 << 120
+MASK_128 = (1 << 128) - 1
+
+# Galois field multiplication for 128 bit GCM elements in reflected bit order
 def gf128_mul_gcm(a: int, b: int) -> int:
-    a = gcm_convert(a)
-    b = gcm_convert(b)
-    result = gf128_mul(a, b)
-    return gcm_convert(result)
+    result = 0
+    while b:
+        if b & GCM_ONE:
+            result ^= a  # Add (XOR) a to result if b's coefficient of x^0 is set
+        a = (a >> 1) ^ REDUCT_POLY_GCM if a & 1 else a >> 1  # Multiply a by x and reduce on overflow
+        b = (b << 1) & MASK_128  # Move to the next coefficient in b
+    return result
 
-# Galois field exponentiation for 128 bit GCM elements
-def gf128_pow_gcm(base: int, exponent: int) -> int:
+# Builds 16 tables of 256 entries for a GF(2)-linear map, given the images of x^0 .. x^127
+# Table p holds the image of every value of byte p, the image of an element is the XOR of 16 lookups
+def build_linear_tables(images: list[int]) -> list[list[int]]:
+    tables = []
+    for position in range(16):
+        table = [0] * 256
+
+        # Bit k of the byte holds the coefficient of x^(8 * position + 7 - k)
+        for k in range(8):
+            bit = 1 << k
+            image = images[8 * position + 7 - k]
+            for lower in range(bit):
+                table[bit | lower] = table[lower] ^ image
+
+        tables.append(table)
+
+    return tables
+
+# XOR of the entries of table i at byte i, a run of k blocks is looked up in 16k tables at once
+def lookup_linear_tables(tables: list[list[int]], data) -> int:
+    result = 0
+    for table, byte in zip(tables, data):
+        result ^= table[byte]
+    return result
 
-    base = gcm_convert(base)
-    exponent = gcm_convert(exponent)
+def apply_linear_tables(tables: list[list[int]], value: int) -> int:
+    return lookup_linear_tables(tables, value.to_bytes(16, byteorder='big'))
 
-    result = 1
+# Squaring and square root are linear over GF(2): (a + b)^2 = a^2 + b^2
+# Their images of x^k are tabulated once on first use
+square_images_cache = None
+sqrt_images_cache = None
+square_tables_cache = None
+sqrt_tables_cache = None
+
+def square_images() -> list[int]:
+    global square_images_cache
+    if square_images_cache is None:
+        square_images_cache = [gf128_mul_gcm(1 << (127 - k), 1 << (127 - k)) for k in range(128)]
+    return square_images_cache
+
+# sqrt(x^2j) = x^j and sqrt(x^(2j + 1)) = x^j * sqrt(x), only sqrt(x) = x^(2^127) needs an exponentiation
+def sqrt_images() -> list[int]:
+    global sqrt_images_cache
+    if sqrt_images_cache is None:
+        sqrt_x = 1 << 126
+        for _ in range(127):
+            sqrt_x = gf128_mul_gcm(sqrt_x, sqrt_x)
+        sqrt_images_cache = [1 << (127 - k // 2) if k % 2 == 0 else gf128_mul_gcm(1 << (127 - k // 2), sqrt_x)
+                             for k in range(128)]
+    return sqrt_images_cache
+
+def gf128_square_gcm(a: int) -> int:
+    global square_tables_cache
+    if square_tables_cache is None:
+        square_tables_cache = build_linear_tables(square_images())
+    return apply_linear_tables(square_tables_cache, a)
+
+def gf128_sqrt_gcm(a: int) -> int:
+    global sqrt_tables_cache
+    if sqrt_tables_cache is None:
+        sqrt_tables_cache = build_linear_tables(sqrt_images())
+    return apply_linear_tables(sqrt_tables_cache, a)
+
+# Galois field exponentiation for 128 bit GCM elements in reflected bit order
+def gf128_pow_gcm(base: int, exponent: int) -> int:
+    result = GCM_ONE
     while exponent > 0:
         if exponent & 1:
-            result = gf128_mul(result, base)
-        base = gf128_mul(base, base)
+            result = gf128_mul_gcm(result, base)
+        base = gf128_square_gcm(base)
         exponent >>= 1
-    return gcm_convert128(result)
+    return result
+
+# Conversion between GCM's reflected bit order and the natural order, where bit i holds x^i
+def reflected_to_natural(value: int) -> int:
+    return int.from_bytes(gcm_convert_bytes(value.to_bytes(16, byteorder='big')), byteorder='little')
+
+def natural_to_reflected(value: int) -> int:
+    return int.from_bytes(gcm_convert_bytes(value.to_bytes(16, byteorder='little')), byteorder='big')
 
 # Galois field inverse for 128 bit GCM elements
-# Done by exponentiation with the power of 2^128 - 2
+# Done with the binary extended euclidean algorithm in natural bit order, keeping a * g1 = u and a * g2 = v mod p
+# The inverse of zero is defined as zero
 def gf128_inverse(a: int) -> int:
-    negative_one =  gcm_convert128((1 << 128) - 2)
-    inverse = gf128_pow_gcm(a, negative_one)
-    return inverse
+    if a == 0:
+        return 0
+
+    u, v = reflected_to_natural(a), REDUCT_POLY
+    g1, g2 = 1, 0
+
+    while u != 1:
+        j = u.bit_length() - v.bit_length()
+        if j < 0:
+            u, v = v, u
+            g1, g2 = g2, g1
+            j = -j
+        # Cancel the leading term of u
+        u ^= v << j
+        g1 ^= g2 << j
+
+    return natural_to_reflected(g1)
+
+# Inverts all elements with a single inversion (Montgomery's trick)
+# Zero elements are skipped and stay zero
+def gf128_batch_inverse(values: list[int]) -> list[int]:
+
+    # prefix[i] holds the product of all non-zero values before index i
+    prefix = []
+    product = GCM_ONE
+    for value in values:
+        prefix.append(product)
+        if value != 0:
+            product = gf128_mul_gcm(product, value)
+
+    # Walk back, peeling off one value of the inverted product at a time
+    inverse = gf128_inverse(product)
+    result = [0] * len(values)
+    for i in range(len(values) - 1, -1, -1):
+        if values[i] != 0:
+            result[i] = gf128_mul_gcm(inverse, prefix[i])
+            inverse = gf128_mul_gcm(inverse, values[i])
+
+    return result
+
+# Polynomials with fewer coefficients than this are multiplied with schoolbook multiplication
+# A coefficient multiplication costs far more than the additions Karatsuba adds, so splitting pays off early
+KARATSUBA_THRESHOLD = 2
+
+# Adds two coefficient lists of GCM elements
+def poly_add(p: list[int], q: list[int]) -> list[int]:
+    if len(p) < len(q):
+        p, q = q, p
+    result = p.copy()
+    for i in range(len(q)):
+        result[i] ^= q[i]
+    return result
+
+# Schoolbook multiplication of coefficient lists of GCM elements
+def poly_mul_schoolbook(p: list[int], q: list[int]) -> list[int]:
+    result = [0] * (len(p) + len(q) - 1)
+    for x in range(len(p)):
+        a = p[x]
+        if a == 0:
+            continue
+        for y in range(len(q)):
+            result[x + y] ^= gf128_mul_gcm(a, q[y])
+    return result
+
+# Karatsuba multiplication of coefficient lists of GCM elements
+# Falls back to schoolbook multiplication below KARATSUBA_THRESHOLD
+def poly_mul(p: list[int], q: list[int]) -> list[int]:
+    if len(p) < len(q):
+        p, q = q, p
+
+    if len(q) < KARATSUBA_THRESHOLD:
+        return poly_mul_schoolbook(p, q)
+
+    result = [0] * (len(p) + len(q) - 1)
+    m = len(p) // 2
+
+    # Unbalanced operands, only split the larger one: p = p0 + X^m * p1
+    if len(q) <= m:
+        for i, c in enumerate(poly_mul(p[:m], q)):
+            result[i] ^= c
+        for i, c in enumerate(poly_mul(p[m:], q)):
+            result[i + m] ^= c
+        return result
+
+    # p * q = z0 + X^m * (z1 - z0 - z2) + X^2m * z2 with z1 = (p0 + p1) * (q0 + q1)
+    p0, p1 = p[:m], p[m:]
+    q0, q1 = q[:m], q[m:]
+
+    z0 = poly_mul(p0, q0)
+    z2 = poly_mul(p1, q1)
+    z1 = poly_mul(poly_add(p0, p1), poly_add(q0, q1))
+
+    for i, c in enumerate(z0):
+        result[i] ^= c
+        result[i + m] ^= c
+    for i, c in enumerate(z2):
+        result[i + 2 * m] ^= c
+        result[i + m] ^= c
+    for i, c in enumerate(z1):
+        result[i + m] ^= c
+
+    return result
 
 def gf_add_bytes(a: bytes, b: bytes) -> bytes:
 
@@ -1,6 +1,10 @@
 import gf.primitives as primitives
+from gf.vector import gf128_vector
 import helper
 
+# divmod scales the divisor with NumPy once quotient length times divisor length reaches this
+DIVMOD_NUMPY_WORK = 256
+
 def reduce_poly(poly: list[bytes]):
     if len(poly) == 0:
         return [b'\x00' * 16]
@@ -55,8 +59,16 @@ class gfpoly:
         return gfpoly.from_int(1 << 7)
     
     def X():
-        return gfpoly([b'\x00' * 16, gf128(1).as_buf()])
+        return gfpoly([b'\x00' * 16, gf128.one().as_buf()])
     
+    # Coefficients as GCM elements in reflected bit order, as used by gf128
+    def coeff_ints(self) -> list[int]:
+        return [int.from_bytes(block, byteorder='big') for block in self.__coeff]
+
+    @staticmethod
+    def from_coeff_ints(values: list[int]):
+        return gfpoly([value.to_bytes(16, byteorder='big') for value in values])
+
     def degree(self):
         return len(self.__coeff) - 1
 
@@ -66,26 +78,9 @@ class gfpoly:
         return gfpoly(list_result)
     
     def __mul__(self, other):
-
-        p = self.__coeff
-        q = other.__coeff
-        result = []
-            
-        for x in range(len(p)):
-            for y in range(len(q)):
-            
-                # Calculate product of coefficients
-                a = gf128.from_buf(p[x])
-                b = gf128.from_buf(q[y])
-                product = (a * b).as_buf()
-                
-                # Increase result degree if necessary
-                if len(result) <= x + y:
-                    result.extend([b'\x00' * 16] * (x + y - len(result) + 1))
-
-                result[x + y] = (gf128.from_buf(result[x + y]) + gf128.from_buf(product)).as_buf()
-        
-        return gfpoly(result)
+        # Convert the coefficients once and multiply them in GCM's reflected bit order
+        product = primitives.poly_mul(self.coeff_ints(), other.coeff_ints())
+        return gfpoly.from_coeff_ints(product)
     
     def pow(self, exponent):
         result = gfpoly.from_int(1 << 7)  # 1 in GCM
@@ -95,42 +90,46 @@ class gfpoly:
         while exponent > 0:
             if exponent & 1:
                 result = result * base
-            base = base * base
+            base = base.square()
             exponent >>= 1
 
         return result
+
+    # Squaring in characteristic 2 only squares the coefficients: (sum a_i X^i)^2 = sum a_i^2 X^2i
+    def square(self):
+        coeffs = self.coeff_ints()
+        result = [0] * (2 * len(coeffs) - 1)
+        for i in range(len(coeffs)):
+            result[2 * i] = primitives.gf128_square_gcm(coeffs[i])
+        return gfpoly.from_coeff_ints(result)
     
     def divmod(self, divisor):
-        remainder = self        
-        result = []
-        
-        while remainder.degree() >= divisor.degree() and remainder.coeff() != [b'\x00' * 16]:
-            # get the lead coefficients
-            remainder_highest_degree = remainder.coeff()[remainder.degree()]
-            divisor_highest_degree = divisor.coeff()[divisor.degree()]
-            
-            rlc = gf128.from_buf(remainder_highest_degree)
-            dlc = gf128.from_buf(divisor_highest_degree)
-            factor = (rlc / dlc).as_buf()
-            
-            degree_delta = remainder.degree() - divisor.degree()
-
-            # Increase result degree if necessary
-            if len(result) <= degree_delta:
-                result.extend([b'\x00' * 16] * (degree_delta - len(result) + 1))
-
+        remainder = self.coeff_ints()
+        divisor_coeffs = divisor.coeff_ints()
+        degree = len(divisor_coeffs) - 1
+
+        # Invert the lead coefficient of the divisor once instead of dividing in every step
+        dlc_inverse = primitives.gf128_inverse(divisor_coeffs[-1])
+        result = [0] * max(len(remainder) - degree, 1)
+
+        # The divisor is scaled once per quotient coefficient, as vector all its coefficients are scaled at once
+        use_numpy = len(result) * len(divisor_coeffs) >= DIVMOD_NUMPY_WORK
+        remainder = gf128_vector(remainder, use_numpy)
+        scale_divisor = gf128_vector(divisor_coeffs, use_numpy).scaler()
+
+        for degree_delta in range(len(remainder) - 1 - degree, -1, -1):
+            # get the lead coefficient of the remainder
+            rlc = remainder[degree_delta + degree]
+            if rlc == 0:
+                continue
+
+            factor = primitives.gf128_mul_gcm(rlc, dlc_inverse)
             result[degree_delta] = factor
-            
-            # Prepend zeros to match degree
-            scaled_res = [b'\x00' * 16] * degree_delta
-            for coeff in divisor.coeff():
-                scaled = gf128.from_buf(coeff) * gf128.from_buf(factor)
-                scaled_res.append(scaled.as_buf())
-            
+
             # Subtract scaled divisor from remainder
-            remainder += gfpoly(scaled_res)
+            remainder.add_at(degree_delta, scale_divisor(factor))
 
-        return (gfpoly(result), remainder)
+        return (gfpoly.from_coeff_ints(result), gfpoly.from_coeff_ints(remainder.to_ints()[:degree]))
     
     def powmod(self, exponent, modulus):
         result = gfpoly.from_int(1 << 7)  # 1 in GCM
@@ -140,31 +139,24 @@ class gfpoly:
         while exponent > 0:
             if exponent & 1:
                 result = (result * base).divmod(modulus)[1] # Get the remainder
-            base = (base * base).divmod(modulus)[1]
+            base = base.square().divmod(modulus)[1]
             exponent >>= 1
 
         return result
     
     def make_monic(self):
         
-        lead_coeff = gf128.from_buf(self.coeff()[-1])
-        for i in range(len(self.__coeff)):
-            self.__coeff[i] = (gf128.from_buf(self.__coeff[i]) / lead_coeff).as_buf()
+        # Invert the lead coefficient once and scale every coefficient with it
+        coeffs = gf128_vector(self.coeff_ints())
+        lead_inverse = primitives.gf128_inverse(coeffs[len(coeffs) - 1])
+        self.__coeff = [value.to_bytes(16, byteorder='big') for value in (coeffs * lead_inverse).to_ints()]
 
         return self
     
     def sqrt(self):
-        coeffs = self.coeff()
-        sqrt_coeffs = []
-
-        # calculate each sqrt of the coefficients at even exponents
-        for i in range(0, len(coeffs), 2):
-            c = coeffs[i]
-            gf_c = gf128.from_buf(c)
-            sqrt_c = gf_c.sqrt()
-            sqrt_coeffs.append(sqrt_c.as_buf())
-
-        return gfpoly(sqrt_coeffs)
+        # calculate each sqrt of the coefficients at even exponents, all of them at once
+        sqrt_coeffs = gf128_vector(self.coeff_ints()[0::2]).sqrt()
+        return gfpoly.from_coeff_ints(sqrt_coeffs.to_ints())
     
     def derivative(self):
         coeffs = self.coeff()
@@ -190,17 +182,22 @@ class gfpoly:
 
         
     
-# Class implementation for finite field elements in GF(2^128) with GCM conversion
+# Class implementation for finite field elements in GF(2^128) with GCM semantic
+# The value is stored in GCM's reflected bit order, conversion only happens on buffer in- and output
 class gf128:
     def __init__(self, value: int):
         self.__value = value
 
     @staticmethod
     def from_buf(value: bytes):
-        return gf128(int.from_bytes(value, byteorder='little'))
+        return gf128(int.from_bytes(value, byteorder='big'))
     
     def as_buf(self):
-        return self.__value.to_bytes(16, byteorder='little')
+        return self.__value.to_bytes(16, byteorder='big')
+
+    @staticmethod
+    def one():
+        return gf128(primitives.GCM_ONE)
     
     @staticmethod
     def from_b64(value: str):
@@ -220,20 +217,26 @@ class gf128:
     
     def inverse(self):
         return gf128((primitives.gf128_inverse(self.__value)))
+
+    # Inverts all elements with a single field inversion, zero elements stay zero
+    @staticmethod
+    def batch_inverse(elements: list['gf128']) -> list['gf128']:
+        inverses = primitives.gf128_batch_inverse([element.__value for element in elements])
+        return [gf128(value) for value in inverses]
     
     def __truediv__(self, other):
         return self * other.inverse()
     
     def pow(self, exponent):
-        result = gf128(1 << 7)
+        result = gf128.one()
         base = self
         while exponent > 0:
             if exponent & 1:
                 result = result * base
-            base = base * base
+            base = gf128(primitives.gf128_square_gcm(base.__value))
             exponent >>= 1
         return result
 
+    # sqrt(a) = a^(2^127), as linear map it is a single table lookup per byte
     def sqrt(self):
-        exponent = 1 << 127  # 2^127
-        return self.pow(exponent)
\ No newline at end of file
+        return gf128(primitives.gf128_sqrt_gcm(self.__value))
\ No newline at end of file
@@ -0,0 +1,153 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import gf.primitives as primitives
+
+# Vectors with fewer elements are kept as Python ints, below that the NumPy call overhead outweighs the loop
+NUMPY_THRESHOLD = 64
+
+MASK_64 = (1 << 64) - 1
+
+# Vector of N GCM elements in reflected bit order
+# With NumPy the elements are held as two uint64 arrays of the high and low halves and every operation is
+# bit-sliced: one vectorized step per bit of the 128 bit elements instead of one Python loop per element
+class gf128_vector:
+    def __init__(self, values: list[int], use_numpy: bool | None = None):
+        if use_numpy is None:
+            use_numpy = len(values) >= NUMPY_THRESHOLD
+        self.use_numpy = use_numpy and np is not None
+
+        if self.use_numpy:
+            self.hi = np.array([value >> 64 for value in values], dtype=np.uint64)
+            self.lo = np.array([value & MASK_64 for value in values], dtype=np.uint64)
+        else:
+            self.values = list(values)
+
+    @staticmethod
+    def from_halves(hi, lo) -> 'gf128_vector':
+        vector = gf128_vector([], True)
+        vector.hi, vector.lo = hi, lo
+        return vector
+
+    def __len__(self):
+        return len(self.hi) if self.use_numpy else len(self.values)
+
+    def __getitem__(self, index: int) -> int:
+        if self.use_numpy:
+            return int(self.hi[index]) << 64 | int(self.lo[index])
+        return self.values[index]
+
+    def to_ints(self) -> list[int]:
+        if self.use_numpy:
+            return [hi << 64 | lo for hi, lo in zip(self.hi.tolist(), self.lo.tolist())]
+        return list(self.values)
+
+    def matching(self, other: 'gf128_vector') -> 'gf128_vector':
+        if other.use_numpy == self.use_numpy:
+            return other
+        return gf128_vector(other.to_ints(), self.use_numpy)
+
+    # Elementwise sum, or the sum of every element with a scalar given as int
+    def __add__(self, other: 'gf128_vector | int') -> 'gf128_vector':
+        if isinstance(other, int):
+            if self.use_numpy:
+                return gf128_vector.from_halves(self.hi ^ np.uint64(other >> 64), self.lo ^ np.uint64(other & MASK_64))
+            return gf128_vector([value ^ other for value in self.values], False)
+
+        other = self.matching(other)
+        if self.use_numpy:
+            return gf128_vector.from_halves(self.hi ^ other.hi, self.lo ^ other.lo)
+        return gf128_vector([a ^ b for a, b in zip(self.values, other.values)], False)
+
+    # Adds other into this vector starting at offset, e.g. a scaled divisor into a remainder
+    def add_at(self, offset: int, other: 'gf128_vector'):
+        other = self.matching(other)
+        if self.use_numpy:
+            self.hi[offset:offset + len(other)] ^= other.hi
+            self.lo[offset:offset + len(other)] ^= other.lo
+        else:
+            for i, value in enumerate(other.values):
+                self.values[offset + i] ^= value
+
+    # Multiplies every element by x: a right shift across both halves, reduced if x^127 was set
+    @staticmethod
+    def mul_x(hi, lo):
+        carry = lo & np.uint64(1)
+        lo = (lo >> np.uint64(1)) | (hi << np.uint64(63))
+        hi = (hi >> np.uint64(1)) ^ (carry * np.uint64(0xE1 << 56))
+        return hi, lo
+
+    # Elementwise product, or the product of every element with a scalar given as int
+    def __mul__(self, other: 'gf128_vector | int') -> 'gf128_vector':
+        if isinstance(other, int):
+            return self.scaler()(other)
+
+        other = self.matching(other)
+        if not self.use_numpy:
+            return gf128_vector([primitives.gf128_mul_gcm(a, b) for a, b in zip(self.values, other.values)], False)
+
+        # Bit k of the other elements selects a * x^k for the sum
+        result_hi = np.zeros_like(self.hi)
+        result_lo = np.zeros_like(self.lo)
+        hi, lo = self.hi, self.lo
+        for k in range(128):
+            word, shift = (other.hi, 63 - k) if k < 64 else (other.lo, 127 - k)
+            mask = np.uint64(0) - ((word >> np.uint64(shift)) & np.uint64(1))
+            result_hi ^= hi & mask
+            result_lo ^= lo & mask
+            hi, lo = gf128_vector.mul_x(hi, lo)
+
+        return gf128_vector.from_halves(result_hi, result_lo)
+
+    # Returns a function that multiplies the vector with a scalar
+    # With NumPy the vector is multiplied with x^0 .. x^127 once, a product then is a single XOR reduction
+    # over the rows selected by the set bits of the scalar
+    def scaler(self):
+        if not self.use_numpy:
+            return lambda scalar: gf128_vector([primitives.gf128_mul_gcm(value, scalar) for value in self.values], False)
+
+        rows_hi = np.empty((128, len(self)), dtype=np.uint64)
+        rows_lo = np.empty((128, len(self)), dtype=np.uint64)
+        hi, lo = self.hi, self.lo
+        for k in range(128):
+            rows_hi[k], rows_lo[k] = hi, lo
+            hi, lo = gf128_vector.mul_x(hi, lo)
+
+        def scale(scalar: int) -> gf128_vector:
+            rows = [k for k in range(128) if scalar >> (127 - k) & 1]
+            if not rows:
+                return gf128_vector.from_halves(np.zeros_like(self.hi), np.zeros_like(self.lo))
+            return gf128_vector.from_halves(np.bitwise_xor.reduce(rows_hi[rows], axis=0),
+                                            np.bitwise_xor.reduce(rows_lo[rows], axis=0))
+        return scale
+
+    # Applies a GF(2) linear map given by the images of x^0 .. x^127 to every element
+    # Bit 127 - k of an element holds the coefficient of x^k, its image is the XOR of the images of its set bits
+    def apply_linear(self, basis: list[int]) -> 'gf128_vector':
+        result_hi = np.zeros_like(self.hi)
+        result_lo = np.zeros_like(self.lo)
+        for k in range(128):
+            word, shift = (self.hi, 63 - k) if k < 64 else (self.lo, 127 - k)
+            mask = np.uint64(0) - ((word >> np.uint64(shift)) & np.uint64(1))
+            result_hi ^= mask & np.uint64(basis[k] >> 64)
+            result_lo ^= mask & np.uint64(basis[k] & MASK_64)
+
+        return gf128_vector.from_halves(result_hi, result_lo)
+
+    # Without NumPy every element is mapped with the byte-indexed tables of the primitives
+    def square(self) -> 'gf128_vector':
+        if not self.use_numpy:
+            return gf128_vector([primitives.gf128_square_gcm(value) for value in self.values], False)
+        return self.apply_linear(primitives.square_images())
+
+    def sqrt(self) -> 'gf128_vector':
+        if not self.use_numpy:
+            return gf128_vector([primitives.gf128_sqrt_gcm(value) for value in self.values], False)
+        return self.apply_linear(primitives.sqrt_images())
+
+    # Inverts all elements with a single field inversion (Montgomery's trick), zero elements stay zero
+    # The inversion is a chain of dependent multiplications, so it runs on Python ints for both backends
+    def inverse(self) -> 'gf128_vector':
+        return gf128_vector(primitives.gf128_batch_inverse(self.to_ints()), self.use_numpy)
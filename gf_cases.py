@@ -1,5 +1,6 @@
 from gf.types import gf128, gfpoly
 from gf.primitives import gf128_mul
+from gf.vector import gf128_vector
 import gf.functions as gff
 
 import helper
@@ -156,4 +157,16 @@ def exec_gf128_mul(assignment):
         a = gf128.from_b64(arguments["a"])
         b = gf128.from_b64(arguments["b"])
 
-        return {"product": (a * b).b64() } 
+        return {"product": (a * b).b64() }
+
+# Test-only action for the batch inversion, "vector" runs it through gf128_vector instead of gf128
+def exec_gf128_batch_inverse(assignment):
+    arguments = assignment["arguments"]
+    elements = [gf128.from_b64(element) for element in arguments["elements"]]
+
+    if arguments.get("vector", False):
+        inverses = [gf128(value) for value in gf128_vector([element.int() for element in elements]).inverse().to_ints()]
+    else:
+        inverses = gf128.batch_inverse(elements)
+
+    return {"inverses": [inverse.b64() for inverse in inverses]}
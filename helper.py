@@ -1,6 +1,12 @@
 import base64
+import os
 import random
 
+import buffers
+
+# Shared random source, set KAUMA_SEED or call seed_random for reproducible runs
+rng = random.Random(os.environ.get("KAUMA_SEED"))
+
 def base64_to_int16(base64_str, byteorder='little'):
     return int.from_bytes(base64.b64decode(base64_str), byteorder=byteorder)
 
@@ -13,8 +19,9 @@ def base64_to_buffer(base64_str):
 def buffer_to_base64(buffer):
     return base64.b64encode(buffer).decode("utf-8")
 
+# XORs two buffers as a whole, the result has the length of the shorter one
 def xor_buf(a, b):
-    return bytes([x ^ y for x, y in zip(a, b)])
+    return buffers.xor(a, b)
 
 # Slices a buffer into 16 byte block array
 def slice_blocks_16(buffer):
@@ -25,10 +32,7 @@ def slice_blocks_16(buffer):
 
 # Merges 16 byte block array into a buffer
 def merge_blocks_16(blocks):
-    buffer = bytearray()
-    for block in blocks:
-        buffer += block
-    return buffer
+    return b''.join(blocks)
 
 def pad_block_16(block, padding = 0):
     return block + bytes([padding] * (16 - len(block)))
@@ -39,5 +43,8 @@ def pad_bytes_16(data):
     else:
         return data + bytes((16 - len(data) % 16) % 16)
     
+def seed_random(seed):
+    rng.seed(seed)
+
 def random_bytes(length):
-    return bytes([random.randint(0, 255) for _ in range(length)])
\ No newline at end of file
+    return rng.randbytes(length)
\ No newline at end of file
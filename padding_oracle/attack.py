@@ -1,10 +1,21 @@
 import padding_oracle.server_simulator as server_simulator
 import padding_oracle.server_connection as server_connection
+import padding_oracle.oracle as oracle
 import helper
 
+import asyncio
+import os
+import tempfile
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from _thread import *
 
+# Number of blocks that are attacked at the same time
+DEFAULT_CONCURRENCY = 8
+
+# Printable ASCII and common whitespace as most likely plaintext bytes, roughly ordered by english letter frequency
+PRINTABLE_BYTES = list(dict.fromkeys(b" etaoinshrdlcumwfgypbvkjxqzETAOINSHRDLCUMWFGYPBVKJXQZ0123456789.,!?'\"-:;()\n\r\t" + bytes(range(0x20, 0x7F))))
+
 # Generates a list of Q-Blocks, where only the byte at the given index is different
 def generate_q_blocks(count, index, fill: bytes) -> list[bytes]:
 
@@ -38,43 +49,114 @@ def next_fill(plaintext: bytes, currentByteIndex: int) -> bytes:
         return fill
 
 
-def decrypt_single_block(ciphertext: bytes, previousBlock: bytes, server: server_connection.ServerConnection) -> bytes:
+# Sends the Q-Blocks to the server and returns the oracle response for each of them
+def query_q_blocks(server: server_connection.ServerConnection, q_blocks: list[bytes]) -> bytes:
+    return server.query(b''.join(q_blocks))
 
-    server.set_ciphertext(ciphertext)
+# Checks whether the candidate is the correct one when more than one padding is valid
+def probe_candidate(server: server_connection.ServerConnection, candidate: int, currentByteIndex: int, fill: bytes) -> bool:
 
-    currentFill = b''
-    plaintext = b''
+    # Build a new block that inverts the 0x0 before the candidate to probe if it fails
+    probe_q_block = b'\x00' * (15 - currentByteIndex - 1) + bytes([0xFF, candidate]) + fill
+
+    # If the padding still is correct, then the candidate is the actual one
+    return query_q_blocks(server, [probe_q_block])[0] == 1
+
+# Sends all 256 Q-Blocks for the current byte at once
+def find_candidate(server: server_connection.ServerConnection, currentByteIndex: int, fill: bytes) -> int:
+
+    # Let the server know we're about to blast it with 256 Q-Blocks
+    response = query_q_blocks(server, generate_q_blocks(256, 15 - currentByteIndex, fill))
+    candidates = get_candidates(response)
+
+    # Two candidates found, check which one of them is the correct one
+    if len(candidates) > 1 and currentByteIndex != 15:
+        if probe_candidate(server, candidates[0], currentByteIndex, fill):
+            return candidates[0]
+        return candidates[1]
+
+    return candidates[0]
+
+# Orders the Q-Block byte values by how likely the plaintext byte they stand for is
+# Printable ASCII comes first, the PKCS7 padding values even before that on the last block
+def candidate_order(previous_byte: int, padding: int, last_block: bool) -> list[int]:
+
+    likely_plaintext = list(PRINTABLE_BYTES)
+    if last_block:
+        likely_plaintext = list(range(1, 17)) + likely_plaintext
+
+    order = []
+    for plaintext_byte in dict.fromkeys(likely_plaintext + list(range(256))):
+        # The padding is valid if plaintext ^ previous byte ^ candidate equals the padding value
+        order.append(plaintext_byte ^ previous_byte ^ padding)
+
+    return order
+
+# Sends the Q-Blocks in batches ordered by the plaintext prior and stops at the first valid padding
+def find_candidate_batched(server: server_connection.ServerConnection, currentByteIndex: int, fill: bytes,
+                           previous_byte: int, last_block: bool, batch_size: int) -> int:
+
+    index = 15 - currentByteIndex
+    order = candidate_order(previous_byte, currentByteIndex + 1, last_block)
+
+    for i in range(0, 256, batch_size):
+        batch = order[i:i + batch_size]
+        response = query_q_blocks(server, [b'\x00' * index + bytes([value]) + fill for value in batch])
+
+        for j in get_candidates(response):
+            # Only the first byte can hit a second valid padding, which the full search catches as double match
+            if currentByteIndex == 0 and not probe_candidate(server, batch[j], currentByteIndex, fill):
+                continue
+            return batch[j]
+
+    raise ValueError("No valid padding found for the current byte")
+
+# Finds the PKCS7 padding length of the last block with a binary search over about 4 queries
+# Corrupting a byte of the previous block breaks the padding only if the byte is part of it
+# Returns None if the unmodified block has no valid padding (e.g. a truncated ciphertext), the search needs it
+def find_padding_length(server: server_connection.ServerConnection, previousBlock: bytes) -> int | None:
+
+    if query_q_blocks(server, [previousBlock])[0] != 1:
+        return None
+
+    # Search the index of the first padding byte, the last byte always is padding
+    low, high = 0, 15
+    while low < high:
+        middle = (low + high) // 2
+
+        # XOR with 0xFF turns every padding value into one larger than a block
+        q_block = bytearray(previousBlock)
+        q_block[middle] ^= 0xFF
+
+        if query_q_blocks(server, [bytes(q_block)])[0] == 1:
+            low = middle + 1
+        else:
+            high = middle
 
-    for currentByteIndex in range(16):
+    return 16 - low
 
-        # Let the server know we're about to blast it with 256 Q-Blocks
-        server.send_q_count(256)
+def decrypt_single_block(ciphertext: bytes, previousBlock: bytes, server: server_connection.ServerConnection,
+                         last_block: bool = False, batch_size: int | None = None, find_padding: bool = False) -> bytes:
 
-        blocks_to_send = b''
-        for q_block in generate_q_blocks(256, 15 - currentByteIndex, currentFill):
-            blocks_to_send += q_block
+    server.set_ciphertext(ciphertext)
 
-        server.send_q_blocks(blocks_to_send)
-        response = server.receive_response(256)
-        candidates = get_candidates(response)
-        
-        # Two candidates found, check which one of them is the correct one
-        if len(candidates) > 1 and currentByteIndex != 15:
+    currentFill = b''
+    plaintext = b''
 
-            # Build a new block that inverts the 0x0 before the candidate to probe if it fails
-            probe_q_block = b'\x00' * (15 - currentByteIndex - 1) + bytes([0xFF, candidates[0]]) + currentFill
+    if find_padding:
+        # The padding bytes are known once the length is, no need to brute-force them
+        padding_length = find_padding_length(server, previousBlock)
+        if padding_length is not None:
+            plaintext = bytes([previousBlock[i] ^ padding_length for i in range(16 - padding_length, 16)])
+            currentFill = next_fill(plaintext, padding_length)
 
-            server.send_q_count(1)
-            server.send_q_blocks(probe_q_block)
-            response = server.receive_response(1)
+    for currentByteIndex in range(len(plaintext), 16):
 
-            # If the padding still is correct, then candidate[0] is the actual one
-            if response[0] == 1:
-                candidate = candidates[0]
-            else:
-                candidate = candidates[1]
+        if batch_size is None:
+            candidate = find_candidate(server, currentByteIndex, currentFill)
         else:
-            candidate = candidates[0]
+            candidate = find_candidate_batched(server, currentByteIndex, currentFill,
+                                               previousBlock[15 - currentByteIndex], last_block, batch_size)
 
         # The next plaintext byte is the candidate XORed with the expected padding value
         plaintext_candidate = (candidate ^ (currentByteIndex + 1))
@@ -84,45 +166,86 @@ def decrypt_single_block(ciphertext: bytes, previousBlock: bytes, server: server
         currentFill = next_fill(plaintext, currentByteIndex + 1)
 
     # zero to terminate the connection
-    server.send_q_count(0)
+    server.end_session()
     
     # XOR the plaintext with the IV/previous block to get the actual plaintext
     plaintext = helper.xor_buf(plaintext, previousBlock)
 
     return plaintext
 
-def attack(ciphertext: bytes, iv: bytes, host: str, port: int) -> bytes:
+# Decrypts a single block with its own oracle taken from the factory
+def decrypt_block(ciphertext: bytes, previousBlock: bytes, oracle_factory, last_block: bool,
+                  batch_size: int | None, find_padding: bool) -> bytes:
+
+    connection = oracle_factory.acquire()
+    try:
+        return decrypt_single_block(ciphertext, previousBlock, connection, last_block, batch_size, find_padding)
+    finally:
+        oracle_factory.release(connection)
+
+# Decrypts all blocks concurrently, every block is independent and uses a separate connection
+# The blocking socket I/O runs on a thread pool, so at most "concurrency" connections are open at once
+# With a batch size the Q-Blocks are sent in batches ordered by a plaintext prior instead of all 256 at once
+# With find_padding the padding length of the last block is searched first and its padding bytes are skipped
+# The oracles come from a ConnectionPool to host and port, unless another factory is passed in (see oracle.py)
+# With a transcript all oracle answers are recorded, so the run can be replayed later without the server
+async def attack_async(ciphertext: bytes, iv: bytes, host: str, port: int, concurrency: int = DEFAULT_CONCURRENCY,
+                       batch_size: int | None = None, find_padding: bool = True, oracle_factory=None,
+                       transcript: oracle.Transcript | None = None) -> bytes:
 
     blocks = helper.slice_blocks_16(ciphertext)
-    plaintext_blocks = []
 
-    for i in range(0, len(blocks)):
+    # First block is decrypted with the IV
+    previous_blocks = [iv] + blocks[:-1]
 
-        connection = server_connection.ServerConnection(host, port)
-        connection.connect()
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if oracle_factory is None:
+            oracle_factory = server_connection.ConnectionPool(host, port, concurrency)
+            await loop.run_in_executor(executor, oracle_factory.prefill, len(blocks))
 
-        if i == 0:
-            # First block is decrypted with the IV
-            plaintext = decrypt_single_block(blocks[i], iv, connection)
-        else:
-            plaintext = decrypt_single_block(blocks[i], blocks[i - 1], connection)
-        plaintext_blocks.append(plaintext)
+        if transcript is not None:
+            oracle_factory = oracle.RecordingFactory(oracle_factory, transcript)
+
+        tasks = []
+        for i in range(len(blocks)):
+            last_block = i == len(blocks) - 1
+            tasks.append(loop.run_in_executor(executor, decrypt_block, blocks[i], previous_blocks[i], oracle_factory,
+                                              last_block, batch_size, last_block and find_padding))
 
-        
+        # gather returns the plaintext blocks in the order of the ciphertext blocks
+        try:
+            plaintext_blocks = await asyncio.gather(*tasks)
+        finally:
+            oracle_factory.close()
 
     return helper.merge_blocks_16(plaintext_blocks)
 
+def attack(ciphertext: bytes, iv: bytes, host: str, port: int, concurrency: int = DEFAULT_CONCURRENCY,
+           batch_size: int | None = None, find_padding: bool = True, oracle_factory=None,
+           transcript: oracle.Transcript | None = None) -> bytes:
+    return asyncio.run(attack_async(ciphertext, iv, host, port, concurrency, batch_size, find_padding,
+                                    oracle_factory, transcript))
+
 simulation_server_started = False
+simulation_server_lock = threading.Lock()
 
 def start_simulation_server():
     global simulation_server_started
-    if simulation_server_started:
-        return
-    server = server_simulator.ServerSimulator()
-    server_thread = threading.Thread(target=server.start_server)
-    server_thread.daemon = True
-    server_thread.start()
-    simulation_server_started = True
+
+    # Testcases may run on several threads, only the first one starts the server
+    with simulation_server_lock:
+        if simulation_server_started:
+            return
+        server = server_simulator.ServerSimulator()
+        ready = threading.Event()
+        server_thread = threading.Thread(target=server.start_server, kwargs={"ready": ready})
+        server_thread.daemon = True
+        server_thread.start()
+
+        # Wait until the server listens, otherwise the first connect can be refused
+        ready.wait()
+        simulation_server_started = True
 
 def exec_attack(assignment):
 
@@ -137,4 +260,44 @@ def exec_attack(assignment):
         host = "127.0.0.1"
         start_simulation_server()
 
-    return {"plaintext": helper.buffer_to_base64(attack(ciphertext, iv, host, port))}
\ No newline at end of file
+    return {"plaintext": helper.buffer_to_base64(attack(ciphertext, iv, host, port))}
+
+# Test-only action that attacks the in-process simulator through a LocalOracle, no sockets involved
+# Optional: "batch_size" sends the Q-Blocks in prior ordered batches, "find_padding" (default on) searches the padding length
+def exec_attack_local(assignment):
+
+    arguments = assignment["arguments"]
+    ciphertext = helper.base64_to_buffer(arguments["ciphertext"])
+    iv = helper.base64_to_buffer(arguments["iv"])
+    batch_size = arguments.get("batch_size")
+    find_padding = arguments.get("find_padding", True)
+
+    plaintext = attack(ciphertext, iv, None, None, batch_size=batch_size, find_padding=find_padding,
+                       oracle_factory=oracle.local_oracle_factory())
+    return {"plaintext": helper.buffer_to_base64(plaintext)}
+
+# Test-only action that records an attack on the in-process simulator, saves and loads the transcript and replays it
+# The replay gets the same "batch_size" and "find_padding" as the recording, see Transcript
+def exec_attack_replay(assignment):
+
+    arguments = assignment["arguments"]
+    ciphertext = helper.base64_to_buffer(arguments["ciphertext"])
+    iv = helper.base64_to_buffer(arguments["iv"])
+    batch_size = arguments.get("batch_size")
+    find_padding = arguments.get("find_padding", True)
+
+    transcript = oracle.Transcript()
+    recorded = attack(ciphertext, iv, None, None, batch_size=batch_size, find_padding=find_padding,
+                      oracle_factory=oracle.local_oracle_factory(), transcript=transcript)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "transcript.json")
+        transcript.save(path)
+        transcript = oracle.Transcript.load(path)
+
+    replayed = attack(ciphertext, iv, None, None, batch_size=batch_size, find_padding=find_padding,
+                      oracle_factory=oracle.replay_oracle_factory(transcript))
+    if replayed != recorded:
+        raise ValueError("Replay returned another plaintext than the recorded run")
+
+    return {"plaintext": helper.buffer_to_base64(replayed)}
@@ -0,0 +1,87 @@
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import padding_oracle.attack as attack
+import padding_oracle.server_connection as server_connection
+import padding_oracle.server_simulator as server_simulator
+import helper
+
+# Load generator for the padding oracle attack
+# Runs concurrent attack sessions against a local simulator with emulated network conditions
+# and reports the oracle queries per second and the end-to-end decrypt latency percentiles
+#
+# python -m padding_oracle.load_generator --sessions 8 --latency 0.02 --jitter 0.005
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+def start_server(simulator: server_simulator.ServerSimulator, host: str, port: int):
+    ready = threading.Event()
+    server_thread = threading.Thread(target=simulator.start_server, args=(host, port), kwargs={"ready": ready})
+    server_thread.daemon = True
+    server_thread.start()
+    ready.wait()
+
+# Encrypts a random plaintext, attacks it and returns the decrypt time and the pool of the session
+def run_session(simulator: server_simulator.ServerSimulator, host: str, port: int, blocks: int, concurrency: int,
+                batch_size: int | None) -> tuple[float, server_connection.ConnectionPool]:
+
+    # One byte short of the block count, so the padding is a single byte
+    plain = helper.random_bytes(16 * blocks - 1)
+    ciphertext = simulator.encrypt(plain)
+
+    pool = server_connection.ConnectionPool(host, port, concurrency)
+    start = time.perf_counter()
+    plaintext = attack.attack(ciphertext, b'\x00' * 16, host, port, concurrency, batch_size, oracle_factory=pool)
+    seconds = time.perf_counter() - start
+
+    if plaintext[:-1] != plain:
+        raise ValueError("Attack returned a wrong plaintext")
+
+    return seconds, pool
+
+def main():
+    parser = argparse.ArgumentParser(description="Drives concurrent padding oracle attacks against the server simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=42070, help="port of the simulator, not the testcase port by default")
+    parser.add_argument("--sessions", type=int, default=4, help="number of concurrent attack sessions")
+    parser.add_argument("--rounds", type=int, default=1, help="number of attacks per session")
+    parser.add_argument("--blocks", type=int, default=4, help="ciphertext blocks per attack")
+    parser.add_argument("--concurrency", type=int, default=attack.DEFAULT_CONCURRENCY, help="connections per attack")
+    parser.add_argument("--batch-size", type=int, help="Q-Blocks per query, all 256 at once by default")
+    parser.add_argument("--cipher", choices=["xor", "aes"], default="xor")
+    parser.add_argument("--latency", type=float, default=0.0, help="latency per query in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform jitter on top of the latency in seconds")
+    parser.add_argument("--bandwidth", type=float, help="bandwidth cap in bytes per second")
+    parser.add_argument("--rate-limit", type=float, help="Q-Blocks per second for each connection")
+    args = parser.parse_args()
+
+    key = helper.random_bytes(16)
+    simulator = server_simulator.ServerSimulator(key, args.cipher, args.latency, args.jitter, args.bandwidth, args.rate_limit)
+    start_server(simulator, args.host, args.port)
+
+    def session():
+        return [run_session(simulator, args.host, args.port, args.blocks, args.concurrency, args.batch_size)
+                for _ in range(args.rounds)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        futures = [executor.submit(session) for _ in range(args.sessions)]
+        results = [result for future in futures for result in future.result()]
+    wall_time = time.perf_counter() - start
+
+    latencies = [seconds for seconds, _ in results]
+    stats = [pool.stats() for _, pool in results]
+    queries = sum(s["queries"] for s in stats)
+    round_trips = sum(s["round_trips"] for s in stats)
+
+    print(f"{len(results)} attacks of {args.blocks} blocks in {wall_time:.3f}s")
+    print(f"{queries} queries in {round_trips} round trips, {queries / wall_time:.0f} queries/s, {round_trips / wall_time:.0f} round trips/s")
+    print("Decrypt latency: " + ", ".join(f"p{p} {percentile(latencies, p):.3f}s" for p in (50, 90, 99)))
+
+if __name__ == "__main__":
+    main()
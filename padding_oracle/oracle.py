@@ -0,0 +1,157 @@
+import json
+import threading
+
+import padding_oracle.server_simulator as server_simulator
+import helper
+
+# Oracle backends for the attack besides the TCP ServerConnection
+# An oracle offers set_ciphertext, query and end_session, a factory hands them out with acquire and release
+# ConnectionPool is the factory for TCP connections, OracleFactory wraps any other backend
+
+# In-process oracle that answers with the simulator directly, no sockets involved
+class LocalOracle:
+    def __init__(self, simulator: server_simulator.ServerSimulator):
+        self.simulator = simulator
+        self.ciphertext = None
+        self.queries = 0
+        self.round_trips = 0
+
+    def set_ciphertext(self, ciphertext: bytes):
+        self.ciphertext = ciphertext
+
+    def query(self, q_blocks: bytes) -> bytes:
+        self.queries += len(q_blocks) // 16
+        self.round_trips += 1
+        return self.simulator.create_padding_oracle_response(self.ciphertext, q_blocks)
+
+    def end_session(self):
+        pass
+
+# Oracle answers recorded per ciphertext and Q-Block
+# Only the Q-Blocks the recorded run sent are known: a batched search stops at the first valid padding and probes
+# other candidates than the full search, so a replay has to use the batch size and padding search of the recording
+class Transcript:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.responses = {}
+
+    def record(self, ciphertext: bytes, q_blocks: bytes, response: bytes):
+        with self.lock:
+            for i in range(len(response)):
+                self.responses[(ciphertext, q_blocks[16 * i:16 * (i + 1)])] = response[i]
+
+    def lookup(self, ciphertext: bytes, q_blocks: bytes) -> bytes:
+        response = bytearray(len(q_blocks) // 16)
+        for i in range(len(response)):
+            key = (ciphertext, q_blocks[16 * i:16 * (i + 1)])
+            if key not in self.responses:
+                raise ValueError(f"Q-Block {q_blocks[16 * i:16 * (i + 1)].hex()} is not in the transcript")
+            response[i] = self.responses[key]
+        return bytes(response)
+
+    def save(self, path: str):
+        with self.lock:
+            entries = [
+                {"ciphertext": helper.buffer_to_base64(ciphertext), "q_block": helper.buffer_to_base64(q_block), "response": response}
+                for (ciphertext, q_block), response in self.responses.items()
+            ]
+        with open(path, 'w') as f:
+            json.dump({"entries": entries}, f)
+
+    @staticmethod
+    def load(path: str) -> "Transcript":
+        with open(path) as f:
+            entries = json.load(f)["entries"]
+
+        transcript = Transcript()
+        for entry in entries:
+            key = (helper.base64_to_buffer(entry["ciphertext"]), helper.base64_to_buffer(entry["q_block"]))
+            transcript.responses[key] = entry["response"]
+        return transcript
+
+# Oracle that serves the answers from a transcript, queries that were never recorded raise a ValueError
+class ReplayOracle:
+    def __init__(self, transcript: Transcript):
+        self.transcript = transcript
+        self.ciphertext = None
+        self.queries = 0
+        self.round_trips = 0
+
+    def set_ciphertext(self, ciphertext: bytes):
+        self.ciphertext = ciphertext
+
+    def query(self, q_blocks: bytes) -> bytes:
+        self.queries += len(q_blocks) // 16
+        self.round_trips += 1
+        return self.transcript.lookup(self.ciphertext, q_blocks)
+
+    def end_session(self):
+        pass
+
+# Wraps another oracle and records all of its answers into the transcript
+class RecordingOracle:
+    def __init__(self, oracle, transcript: Transcript):
+        self.oracle = oracle
+        self.transcript = transcript
+        self.ciphertext = None
+
+    def set_ciphertext(self, ciphertext: bytes):
+        self.ciphertext = ciphertext
+        self.oracle.set_ciphertext(ciphertext)
+
+    def query(self, q_blocks: bytes) -> bytes:
+        response = self.oracle.query(q_blocks)
+        self.transcript.record(self.ciphertext, q_blocks, response)
+        return response
+
+    def end_session(self):
+        self.oracle.end_session()
+
+# Hands out a new oracle per block and sums up their counters once they are released
+class OracleFactory:
+    def __init__(self, create):
+        self.create = create
+        self.lock = threading.Lock()
+        self.released = []
+
+    def acquire(self):
+        return self.create()
+
+    def release(self, oracle):
+        with self.lock:
+            self.released.append(oracle)
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "queries": sum(oracle.queries for oracle in self.released),
+                "round_trips": sum(oracle.round_trips for oracle in self.released),
+            }
+
+# Records the answers of the oracles of another factory, e.g. a ConnectionPool on a live run
+class RecordingFactory:
+    def __init__(self, factory, transcript: Transcript):
+        self.factory = factory
+        self.transcript = transcript
+
+    def acquire(self) -> RecordingOracle:
+        return RecordingOracle(self.factory.acquire(), self.transcript)
+
+    def release(self, oracle: RecordingOracle):
+        self.factory.release(oracle.oracle)
+
+    def close(self):
+        self.factory.close()
+
+    def stats(self) -> dict:
+        return self.factory.stats()
+
+def local_oracle_factory(simulator: server_simulator.ServerSimulator | None = None) -> OracleFactory:
+    simulator = simulator or server_simulator.ServerSimulator()
+    return OracleFactory(lambda: LocalOracle(simulator))
+
+def replay_oracle_factory(transcript: Transcript) -> OracleFactory:
+    return OracleFactory(lambda: ReplayOracle(transcript))
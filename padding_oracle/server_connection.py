@@ -1,23 +1,184 @@
 import socket
+import threading
+import time
+
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_RETRIES = 2
+
+# Upper bounds of the round-trip latency histogram buckets in milliseconds
+LATENCY_BUCKETS_MS = [0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, float('inf')]
 
 class ServerConnection:
-    def __init__(self, host: str, port: int):
+    def __init__(self, host: str, port: int, timeout: float | None = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES):
         self.host = host
         self.port = port
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    
+        self.timeout = timeout
+        self.retries = retries
+        self.sock = None
+        self.ciphertext = None
+
+        # Responses are read into this buffer, it grows to the largest batch once
+        self.response_buffer = bytearray(256)
+
+        # Counters of this connection
+        self.bytes_sent = 0
+        self.queries = 0
+        self.round_trips = 0
+        self.reconnects = 0
+        self.latency_histogram = [0] * len(LATENCY_BUCKETS_MS)
+
     def connect(self):
-        self.sock.connect((self.host, self.port))
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+
+        # The 2 byte count messages must not wait for the ACK of the previous segment
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    # Opens a new session and sends the ciphertext again, the oracle keeps no state across queries
+    def reconnect(self):
+        self.close()
+        self.connect()
+        self.reconnects += 1
+        if self.ciphertext is not None:
+            self.send(self.ciphertext)
+
+    def send(self, data: bytes):
+        self.sock.sendall(data)
+        self.bytes_sent += len(data)
 
     def set_ciphertext(self, ciphertext):
-        self.sock.sendall(ciphertext)
+        self.ciphertext = ciphertext
+        self.send(ciphertext)
 
     def send_q_count(self, count):
-        self.sock.sendall(count.to_bytes(2, byteorder='little'))
+        self.send(count.to_bytes(2, byteorder='little'))
 
     def send_q_blocks(self, block):
-        self.sock.sendall(block)
-    
+        self.send(block)
+
+    # A count of zero makes the server close the session
+    def end_session(self):
+        self.send_q_count(0)
+
+    # Reads exactly count bytes, the response may arrive in several segments
     def receive_response(self, count):
-        return self.sock.recv(count)
-    
+        if len(self.response_buffer) < count:
+            self.response_buffer = bytearray(count)
+
+        view = memoryview(self.response_buffer)
+        received = 0
+        while received < count:
+            length = self.sock.recv_into(view[received:count])
+            if length == 0:
+                raise ConnectionError("Server closed the connection")
+            received += length
+
+        return bytes(view[:count])
+
+    # Sends a batch of Q-Blocks and returns the oracle response for each of them
+    # On timeouts or connection errors the session is reopened and the batch is sent again
+    def query(self, q_blocks: bytes) -> bytes:
+        count = len(q_blocks) // 16
+
+        for attempt in range(self.retries + 1):
+            try:
+                start = time.perf_counter()
+
+                # Count and Q-Blocks go out in a single segment
+                self.send(count.to_bytes(2, byteorder='little') + q_blocks)
+                response = self.receive_response(count)
+
+                self.record_round_trip(time.perf_counter() - start, count)
+                return response
+
+            except OSError:
+                if attempt == self.retries:
+                    raise
+                self.reconnect()
+
+    def record_round_trip(self, seconds: float, count: int):
+        self.queries += count
+        self.round_trips += 1
+
+        milliseconds = seconds * 1000
+        for i, bucket in enumerate(LATENCY_BUCKETS_MS):
+            if milliseconds <= bucket:
+                self.latency_histogram[i] += 1
+                break
+
+    def stats(self) -> dict:
+        return {
+            "bytes_sent": self.bytes_sent,
+            "queries": self.queries,
+            "round_trips": self.round_trips,
+            "reconnects": self.reconnects,
+            "latency_histogram_ms": {str(bucket): n for bucket, n in zip(LATENCY_BUCKETS_MS, self.latency_histogram)},
+        }
+
+# Pool of connections for the attack, at most size connections are in use at once
+# The protocol ends a session after each block, so released connections are closed and warm ones opened in advance
+class ConnectionPool:
+    def __init__(self, host: str, port: int, size: int, timeout: float | None = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(size)
+        self.size = size
+        self.idle = []
+        self.closed = []
+
+    def new_connection(self) -> ServerConnection:
+        connection = ServerConnection(self.host, self.port, self.timeout, self.retries)
+        connection.connect()
+        return connection
+
+    # Opens connections up front, so the first blocks do not wait for the handshake
+    def prefill(self, count: int | None = None):
+        count = self.size if count is None else min(count, self.size)
+        connections = [self.new_connection() for _ in range(count - len(self.idle))]
+        with self.lock:
+            self.idle.extend(connections)
+
+    def acquire(self) -> ServerConnection:
+        self.slots.acquire()
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        try:
+            return self.new_connection()
+        except OSError:
+            self.slots.release()
+            raise
+
+    def release(self, connection: ServerConnection):
+        connection.close()
+        with self.lock:
+            self.closed.append(connection)
+        self.slots.release()
+
+    def close(self):
+        with self.lock:
+            for connection in self.idle:
+                connection.close()
+            self.idle.clear()
+
+    # Sums up the counters of all connections that were handed out
+    def stats(self) -> dict:
+        with self.lock:
+            connections = list(self.closed)
+
+        stats = {"connections": len(connections), "bytes_sent": 0, "queries": 0, "round_trips": 0, "reconnects": 0}
+        histogram = [0] * len(LATENCY_BUCKETS_MS)
+        for connection in connections:
+            for key in ("bytes_sent", "queries", "round_trips", "reconnects"):
+                stats[key] += getattr(connection, key)
+            histogram = [a + b for a, b in zip(histogram, connection.latency_histogram)]
+
+        stats["latency_histogram_ms"] = {str(bucket): n for bucket, n in zip(LATENCY_BUCKETS_MS, histogram)}
+        return stats
@@ -1,19 +1,52 @@
 from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+import errno
+import random
 import socket
+import threading
+import time
 
 import helper
 
 # This is a simulator for the padding oracle server in order to test the padding oracle attack
-# The server simulator uses XOR encryption
+# The server simulator uses XOR encryption or AES and serves every connection on its own thread
+# Network conditions can be emulated per query: latency in seconds with a uniform jitter on top,
+# a bandwidth cap in bytes per second and a rate limit in Q-Blocks per second for each connection
 
 class ServerSimulator:
-    def __init__(self, demo_key=b'\x01\x02\x03\x04\x05\x06\x07\x08\x09\x0a\x0b\x0c\x0d\x0e\x0f\x10'):
+    def __init__(self, demo_key=b'\x01\x02\x03\x04\x05\x06\x07\x08\x09\x0a\x0b\x0c\x0d\x0e\x0f\x10', cipher="xor",
+                 latency: float = 0.0, jitter: float = 0.0, bandwidth: float | None = None, rate_limit: float | None = None):
+        if cipher not in ("xor", "aes"):
+            raise ValueError(f"Unknown cipher '{cipher}'")
+
         self.demo_key = demo_key
-        self.initial_ciphertext = b''
-        self.excepted_q_blocks = 0
-        self.q_blocks = []
+        self.cipher = cipher
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.rate_limit = rate_limit
+        self.aes = Cipher(algorithms.AES(demo_key), modes.ECB()) if cipher == "aes" else None
+
+        # Separate random source, the emulated jitter must not change seeded testcases
+        self.rng = random.Random()
+
+    # Encrypts or decrypts a single block with the configured cipher
+    def encrypt_block(self, block: bytes) -> bytes:
+        if self.cipher == "aes":
+            encryptor = self.aes.encryptor()
+            return encryptor.update(block) + encryptor.finalize()
+
+        # Cipher is a simple XOR for demonstration
+        return helper.xor_buf(block, self.demo_key)
 
-    # Simple encrypt with PKCS7 padding, fixed Key and IV
+    def decrypt_block(self, block: bytes) -> bytes:
+        if self.cipher == "aes":
+            decryptor = self.aes.decryptor()
+            return decryptor.update(block) + decryptor.finalize()
+
+        return helper.xor_buf(block, self.demo_key)
+
+    # Encrypt with PKCS7 padding, fixed Key and IV
     def encrypt(self, plain):
         # Pad first
         unpadder = padding.PKCS7(128).padder()
@@ -26,72 +59,114 @@ class ServerSimulator:
         for block in blocks:
             # Do CBC
             block = helper.xor_buf(block, prev_block)
-
-            # Cipher is a simple XOR for demonstration
-            block = helper.xor_buf(block, self.demo_key)
+            block = self.encrypt_block(block)
             prev_block = block
             ciphertext += block
 
         return ciphertext
 
-    def create_padding_oracle_response(self):
-        response = b''
+    # Checks the PKCS7 padding of a single plaintext block
+    @staticmethod
+    def valid_padding(plain: bytes) -> bool:
+        pad = plain[15]
+        return 1 <= pad <= 16 and plain[16 - pad:] == bytes([pad]) * pad
+
+    # Returns the padding oracle response for a whole batch of Q-Blocks
+    def create_padding_oracle_response(self, ciphertext: bytes, q_blocks: bytes) -> bytes:
+
+        # Decrypt the block once for all Q-Blocks
+        decrypted = self.decrypt_block(ciphertext)
+
+        # Do CBC with every Q-Block at once
+        count = len(q_blocks) // 16
+        plains = helper.xor_buf(q_blocks, decrypted * count)
+
+        return bytes([self.valid_padding(plains[i:i + 16]) for i in range(0, count * 16, 16)])
+
+    # Receives exactly count bytes, a single recv may return only part of them
+    @staticmethod
+    def recv_exact(conn: socket.socket, count: int) -> bytes | None:
+        buffer = bytearray(count)
+        view = memoryview(buffer)
+        received = 0
+        while received < count:
+            length = conn.recv_into(view[received:])
+            if length == 0:
+                return None  # Connection closed
+            received += length
+        return bytes(buffer)
+
+    # Sleeps for the emulated network time of a query and returns when the connection may send again
+    # The rate limit spaces the queries of a connection, bursts are not allowed
+    def emulate_network(self, q_count: int, next_allowed: float) -> float:
+        delay = self.latency + self.rng.uniform(0, self.jitter)
+
+        # Request of count and Q-Blocks plus the response
+        if self.bandwidth is not None:
+            delay += (2 + 17 * q_count) / self.bandwidth
+
+        now = time.monotonic()
+        if self.rate_limit is not None:
+            delay = max(delay, next_allowed - now)
+            next_allowed = max(now, next_allowed) + q_count / self.rate_limit
+
+        if delay > 0:
+            time.sleep(delay)
+        return next_allowed
+
+    # Serves a single client, all state of the connection is kept locally
+    def handle_connection(self, conn: socket.socket):
+        with conn:
+            ciphertext = self.recv_exact(conn, 16)
+            if ciphertext is None:
+                return
+
+            next_allowed = 0.0
 
-        # Try to decrypt the ciphertext with all Q-Blocks
-        for q_block in self.q_blocks:
-            # Decrypt the block
-            plain = helper.xor_buf(self.initial_ciphertext, self.demo_key)
+            while True:
+                q_count_data = self.recv_exact(conn, 2)
+                if q_count_data is None:
+                    break
+                q_count = int.from_bytes(q_count_data, byteorder='little')
 
-            # Do CBC
-            plain = helper.xor_buf(plain, q_block)
+                # Disconnect if zero blocks are expected
+                if q_count == 0:
+                    break
 
-            try:
-                unpadder = padding.PKCS7(128).unpadder()
-                unpadder.update(plain)
-                unpadder.finalize()
-            except ValueError:
-                response += b'\x00'  # Padding is invalid
-            else:
-                response += b'\x01'
-
-        return response
-
-    # Appends a new Q-Block and returns the padding oracle response on the last block
-    def add_q_block(self, block):
-        self.q_blocks.append(block)
-        self.excepted_q_blocks -= 1
-
-        if self.excepted_q_blocks == 0:
-            # Send the last block to the server
-            response = self.create_padding_oracle_response()
-            self.q_blocks.clear()
-            return response
-
-    def start_server(self, host='127.0.0.1', port=42069):
+                q_blocks = self.recv_exact(conn, q_count * 16)
+                if q_blocks is None:
+                    break
+
+                next_allowed = self.emulate_network(q_count, next_allowed)
+                conn.sendall(self.create_padding_oracle_response(ciphertext, q_blocks))
+
+    def start_server(self, host='127.0.0.1', port=42069, ready=None):
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
-            server_socket.bind((host, port))
-            server_socket.listen(1)
+            # Allow rebinding while connections of a previous run are still in TIME_WAIT
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            # With SO_REUSEADDR a second bind can succeed and only listen fails, so both are checked
+            # Attacks open a connection per block at once, keep them queued until they are served
+            try:
+                server_socket.bind((host, port))
+                server_socket.listen()
+            except OSError as e:
+                if ready is None:
+                    raise
+                ready.set()
+                # Another process (e.g. a parallel test worker) already runs a simulator on this port
+                if e.errno == errno.EADDRINUSE:
+                    return
+                raise
+
+            if ready is not None:
+                ready.set()
             #print(f"Server listening on {host}:{port}")
 
+            # Every connection is served on its own thread
             while True:
                 conn, addr = server_socket.accept()
-                with conn:
-                    #print("Connected " + str(addr))
-                    self.initial_ciphertext = conn.recv(16)
-
-                    while True:
-                        q_count_data = conn.recv(2)
-                        self.excepted_q_blocks = int.from_bytes(q_count_data, byteorder='little')
-
-                        # Disconnect if zero blocks are expected
-                        if self.excepted_q_blocks == 0:
-                            break
-
-                        total_bytes_expected = self.excepted_q_blocks * 16
-                        bytes_received = conn.recv(total_bytes_expected)
-
-                        for i in range(0, total_bytes_expected, 16):
-                            q_block = bytes_received[i:i + 16]
-                            response = self.add_q_block(q_block)
-                            if response:
-                                conn.sendall(response)
\ No newline at end of file
+                #print("Connected " + str(addr))
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                connection_thread = threading.Thread(target=self.handle_connection, args=(conn,))
+                connection_thread.daemon = True
+                connection_thread.start()
@@ -1,6 +1,7 @@
 import os
 import sys
 import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import add_sub_number
 import padding_oracle.attack
@@ -38,32 +39,71 @@ handler_table = {
     "gfpoly_factor_sff": gf_cases.exec_gfpoly,
     "gfpoly_factor_ddf": gf_cases.exec_gfpoly,
     "gfpoly_factor_edf": gf_cases.exec_gfpoly,
-    "gcm_crack": gcm_crack.exec_gcm_crack
+    "gcm_crack": gcm_crack.exec_gcm_crack,
+
+    # Test-only actions
+    "padding_oracle_local": padding_oracle.attack.exec_attack_local,
+    "padding_oracle_replay": padding_oracle.attack.exec_attack_replay,
+    "gf128_batch_inverse": gf_cases.exec_gf128_batch_inverse,
+    "gcm_stream_encrypt": gcm.exec_stream,
+    "gcm_stream_decrypt": gcm.exec_stream
 }
 
-if len(sys.argv) != 2:
-	print("syntax: %s <jsonfile>" % (sys.argv[0]))
-	sys.exit(1)
+# Actions that mostly wait on the network, they run on threads in parallel mode
+# Every other action is pure CPU work and runs on a process pool
+IO_BOUND_ACTIONS = {"padding_oracle"}
 
-json_file = sys.argv[1]
+def add_response(responses, testcase_id, response):
+    responses["responses"][testcase_id] = response
 
-with open(json_file) as f:
-    assignment = json.load(f)
+# Runs a single testcase through the handler for its action
+def handle_testcase(testcase_content):
+    handler = handler_table[testcase_content["action"]]
+    return handler(testcase_content)
 
-responses = {"responses": {}}
+# Runs all known testcases and returns their responses in the order of the assignment
+def run_testcases(testcases, parallel=False):
+    known_testcases = {}
+    for testcase, testcase_content in testcases.items():
 
-def add_response(testcase_id, response):
-    responses["responses"][testcase_id] = response
+        action = testcase_content["action"]
+        if action not in handler_table:
+            print(f"Handler for action '{action}' not found")
+            continue
+
+        known_testcases[testcase] = testcase_content
+
+    if not parallel:
+        return {testcase: handle_testcase(content) for testcase, content in known_testcases.items()}
+
+    with ProcessPoolExecutor() as processes, ThreadPoolExecutor() as threads:
+        futures = {}
+        for testcase, content in known_testcases.items():
+            executor = threads if content["action"] in IO_BOUND_ACTIONS else processes
+            futures[testcase] = executor.submit(handle_testcase, content)
+
+        # Collect in submission order, so the output does not depend on which testcase finished first
+        return {testcase: future.result() for testcase, future in futures.items()}
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    parallel = "--parallel" in args
+    if parallel:
+        args.remove("--parallel")
+
+    if len(args) != 1:
+        print("syntax: %s [--parallel] <jsonfile>" % (sys.argv[0]))
+        sys.exit(1)
+
+    json_file = args[0]
 
-for testcase, testcase_content in assignment["testcases"].items():
+    with open(json_file) as f:
+        assignment = json.load(f)
 
-    action = testcase_content["action"]
-    handler = handler_table.get(action) # Get the handler for the action
-    if handler is None:
-        print(f"Handler for action '{action}' not found")
-        continue
+    responses = {"responses": {}}
 
-    response = handler(testcase_content)
-    add_response(testcase, response)
+    for testcase, response in run_testcases(assignment["testcases"], parallel).items():
+        add_response(responses, testcase, response)
 
-print(json.dumps(responses, indent=4))
+    print(json.dumps(responses, indent=4))
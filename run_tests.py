@@ -1,50 +1,122 @@
 import os
-import subprocess
 import sys
 import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 
-failed_tests = []
-total_tests = 0
-
-def print_fail(fail_message, expected, got, errors, test_file):
-    print(fail_message)
-    print(f"Expected: {expected}")
-    print(f"Got: {got}")
-    if errors:
-        print(f"Errors: {errors}")
-    failed_tests.append(test_file)
-
-def run_test(test_file):
-    
-    result_file = test_file.replace('cases', 'expected')
-    with open(result_file) as f:
-        expected_data = f.read()
-    
-    # Launch the redirector.py script with the test file
-    process = subprocess.Popen([sys.executable, 'redirector.py', test_file], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    stdout, stderr = process.communicate()
-    
+import helper
+
+test_dir = 'tests/cases/'
+
+# Runs a single testcase in-process and measures its wall time
+# Executed in the worker processes, so the handler table is only imported there
+def run_testcase(testcase_id, testcase_content, seed):
+    import redirector
+
+    # Seed per testcase, so the result does not depend on which worker ran what before
+    if seed is not None:
+        helper.seed_random(f"{seed}:{testcase_id}")
+
+    start = time.perf_counter()
     try:
-        json_data = json.loads(stdout)
-    except json.JSONDecodeError:
-        print_fail(f"Test {test_file} failed. Invalid JSON", expected_data, stdout, stderr, test_file)
-        return
-    
-    # compare if result matches expected data on an object level
-    if sorted(json_data.items()) == sorted(json.loads(expected_data).items()):
-        print(f"Test {test_file} passed.")
-    else:
-        print_fail(f"Test {test_file} failed.", expected_data, stdout, stderr, test_file)
+        response = redirector.handle_testcase(testcase_content)
+        error = None
+    except Exception:
+        response = None
+        error = traceback.format_exc()
 
+    # Round-trip through JSON to compare exactly what redirector.py would print
+    response = json.loads(json.dumps(response))
+    return response, error, time.perf_counter() - start
 
-test_dir = 'tests/cases/'
+# Loads all testcases of the case files together with their expected responses
+# Also returns the expected responses without a testcase, comparing whole files used to catch those
+def load_testcases(test_files):
+    testcases = []
+    orphans = []
+    for test_file in test_files:
+
+        with open(test_file) as f:
+            cases = json.load(f)["testcases"]
+        with open(test_file.replace('cases', 'expected')) as f:
+            expected = json.load(f)["responses"]
+
+        for testcase_id, testcase_content in cases.items():
+            testcases.append((test_file, testcase_id, testcase_content, expected.get(testcase_id)))
+
+        expected_file = test_file.replace('cases', 'expected')
+        orphans.extend((expected_file, testcase_id) for testcase_id in expected if testcase_id not in cases)
+
+    return testcases, orphans
+
+def print_fail(result):
+    print(f"Test {result['file']}:{result['id']} failed in {result['seconds']:.3f}s.")
+    print(f"Expected: {json.dumps(result['expected'])}")
+    print(f"Got: {json.dumps(result['got'])}")
+    if result['error']:
+        print(f"Errors: {result['error']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs all testcases in-process on a pool of worker processes")
+    parser.add_argument("files", nargs="*", help="case files to run, defaults to all files in tests/cases")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--report", help="write a JSON report with the result and wall time of every testcase")
+    parser.add_argument("--seed", help="seed the random source of every testcase for reproducible runs")
+    args = parser.parse_args()
+
+    # Get all json files in cases directory
+    test_files = args.files or sorted(os.path.join(test_dir, f) for f in os.listdir(test_dir) if f.endswith('.json'))
+    testcases, orphans = load_testcases(test_files)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(run_testcase, testcase_id, content, args.seed) for _, testcase_id, content, _ in testcases]
+
+        # Results are collected in testcase order to keep the output deterministic
+        results = []
+        for (test_file, testcase_id, content, expected), future in zip(testcases, futures):
+            got, error, seconds = future.result()
+            results.append({
+                "file": test_file,
+                "id": testcase_id,
+                "action": content["action"],
+                "passed": error is None and expected is not None and got == expected,
+                "seconds": seconds,
+                "expected": expected,
+                "got": got,
+                "error": error,
+            })
+    wall_time = time.perf_counter() - start
+
+    for result in results:
+        if result["passed"]:
+            print(f"Test {result['file']}:{result['id']} passed in {result['seconds']:.3f}s.")
+        else:
+            print_fail(result)
+
+    for test_file, testcase_id in orphans:
+        print(f"Expected response {test_file}:{testcase_id} has no testcase.")
+
+    failed_tests = [f"{result['file']}:{result['id']}" for result in results if not result["passed"]]
+    print(f"{len(results) - len(failed_tests)}/{len(results)} tests passed in {wall_time:.3f}s.")
+    failed_tests += [f"{test_file}:{testcase_id}" for test_file, testcase_id in orphans]
+    if failed_tests:
+        print(f"Failed tests: {', '.join(failed_tests)}")
+
+    if args.report:
+        report = {
+            "total": len(results),
+            "passed": len(results) - len(failed_tests),
+            "wall_time": wall_time,
+            "testcases": [{key: result[key] for key in ("file", "id", "action", "passed", "seconds", "error")} for result in results],
+            "orphaned_responses": [{"file": test_file, "id": testcase_id} for test_file, testcase_id in orphans],
+        }
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=4)
+
+    return 1 if failed_tests else 0
 
-# Get all json files in cases directory and run tests on them
-for test_file in os.listdir(test_dir):
-    if test_file.endswith('.json'):
-        total_tests += 1
-        run_test(os.path.join(test_dir, test_file))
-    
-print(f"{total_tests - len(failed_tests)}/{total_tests} tests passed.")
-if failed_tests:
-    print(f"Failed tests: {', '.join(failed_tests)}")
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
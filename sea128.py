@@ -1,26 +1,37 @@
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
+import buffers
 import helper
 
 XOR_VALUE = 0xc0ffeec0ffeec0ffeec0ffeec0ffee11.to_bytes(16, byteorder='big')
 
-def encrypt(key: bytes, data: bytes):
+# SEA-128 bound to a single key, the AES cipher object is created once and reused for every buffer
+# Whole buffers of blocks are processed with one ECB call and one XOR for the constant
+class sea128_context:
+    def __init__(self, key: bytes):
+        self.key = key
+        self.__cipher = Cipher(algorithms.AES(key), modes.ECB())
 
-    cipher = Cipher(algorithms.AES(key), modes.ECB())
-    encryptor = cipher.encryptor()
-    ciphertext = encryptor.update(data) + encryptor.finalize()
+    def encrypt(self, data: bytes) -> bytes:
+        encryptor = self.__cipher.encryptor()
+        ciphertext = encryptor.update(data) + encryptor.finalize()
 
-    return helper.xor_buf(ciphertext, XOR_VALUE)
+        # Apply the XOR constant to every block of the buffer
+        return buffers.xor_repeat(ciphertext, XOR_VALUE)
 
+    def decrypt(self, data: bytes) -> bytes:
+        data = buffers.xor_repeat(data, XOR_VALUE)
 
-def decrypt(key: bytes, data: bytes):
-    
-    data = helper.xor_buf(data, XOR_VALUE)
+        decryptor = self.__cipher.decryptor()
+        return decryptor.update(data) + decryptor.finalize()
 
-    cipher = Cipher(algorithms.AES(key), modes.ECB())
-    decryptor = cipher.decryptor()
-    plaintext = decryptor.update(data) + decryptor.finalize()
-    return plaintext
+
+def encrypt(key: bytes, data: bytes):
+    return sea128_context(key).encrypt(data)
+
+
+def decrypt(key: bytes, data: bytes):
+    return sea128_context(key).decrypt(data)
 
 
 def exec_cipher(assignment):
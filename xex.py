@@ -1,57 +1,48 @@
 from gf.primitives import gf128_mul
 import sea128
 
+import buffers
 import helper
 
-# Splits the input blocks, prepare the tweak and split the key
-def prepare_input(key: bytes, tweak: bytes, data: bytes) -> tuple[bytes, bytes, list[bytes]]:
-    blocks = helper.slice_blocks_16(data)
+# Splits the key and encrypts the tweak with the second half
+def prepare_input(key: bytes, tweak: bytes) -> tuple[sea128.sea128_context, bytes]:
     key1, key2 = helper.slice_blocks_16(key)[:2]
     tweak = sea128.encrypt(key2, tweak)
 
-    return (key1, tweak, blocks)
+    return (sea128.sea128_context(key1), tweak)
 
-def gf128_mul_alpha(tweak: bytes ) -> bytes:
+# Writes the tweaks of all blocks into one buffer, the tweak is multiplied with alpha from block to block
+def tweak_sequence(tweak: bytes, count: int) -> bytearray:
+    tweaks = bytearray(16 * count)
     numeric_tweak = int.from_bytes(tweak, byteorder="little")
-    return gf128_mul(numeric_tweak, 0x2).to_bytes(16, byteorder="little") # multiply with 0x2 ^= 0010 ^= alpha
+    for i in range(count):
+        tweaks[16 * i:16 * (i + 1)] = numeric_tweak.to_bytes(16, byteorder="little")
+        numeric_tweak = gf128_mul(numeric_tweak, 0x2) # multiply with 0x2 ^= 0010 ^= alpha
+    return tweaks
 
 
-def encrypt(key: bytes, tweak: bytes, data: bytes) -> list[bytes]:
+# Pre-whitening, ECB and post-whitening each run once over the whole buffer
+# Both whitening passes write into the same preallocated output buffer
+def encrypt(key: bytes, tweak: bytes, data: bytes) -> bytearray:
 
-    encrypted_blocks = []
-    key1, tweak, blocks = prepare_input(key, tweak, data)
+    cipher, tweak = prepare_input(key, tweak)
+    tweaks = tweak_sequence(tweak, (len(data) + 15) // 16)
 
-    for i in range(len(blocks)):
-        plaintext = blocks[i]
+    out = bytearray(len(data))
+    buffers.xor_into(out, data, tweaks)
+    buffers.xor_into(out, cipher.encrypt(out), tweaks)
+    return out
 
-        tweaked_plaintext = helper.xor_buf(plaintext, tweak)
-        encrypted_plaintext = sea128.encrypt(key1, tweaked_plaintext)
-        encrypted_block = helper.xor_buf(encrypted_plaintext, tweak)
 
-        encrypted_blocks.append(encrypted_block)
+def decrypt(key: bytes, tweak: bytes, data: bytes) -> bytearray:
 
-        tweak = gf128_mul_alpha(tweak)
+    cipher, tweak = prepare_input(key, tweak)
+    tweaks = tweak_sequence(tweak, (len(data) + 15) // 16)
 
-    return encrypted_blocks
-
-
-def decrypt(key: bytes, tweak: bytes, data: bytes) -> list[bytes]:
-    
-    decrypted_blocks = []
-    key1, tweak, blocks = prepare_input(key, tweak, data)
-
-    for i in range(len(blocks)):
-        encrypted_block = blocks[i]
-
-        decrypted_block = helper.xor_buf(encrypted_block, tweak)
-        decrypted_plaintext = sea128.decrypt(key1, decrypted_block)
-        plaintext = helper.xor_buf(decrypted_plaintext, tweak)
-
-        decrypted_blocks.append(plaintext)
-        
-        tweak = gf128_mul_alpha(tweak)
-
-    return decrypted_blocks
+    out = bytearray(len(data))
+    buffers.xor_into(out, data, tweaks)
+    buffers.xor_into(out, cipher.decrypt(out), tweaks)
+    return out
 
 
 def exec_cipher(assignment):
@@ -63,10 +54,7 @@ def exec_cipher(assignment):
     input = helper.base64_to_buffer(arguments["input"])
 
     if mode == "encrypt":
-        encrypted_blocks = encrypt(key, tweak, input)
-        return {"output": helper.buffer_to_base64(helper.merge_blocks_16(encrypted_blocks))}
+        return {"output": helper.buffer_to_base64(encrypt(key, tweak, input))}
     
     elif mode == "decrypt":
-        decrypted_blocks = decrypt(key, tweak, input)
-        return {"output": helper.buffer_to_base64(helper.merge_blocks_16(decrypted_blocks))}
-    
\ No newline at end of file
+        return {"output": helper.buffer_to_base64(decrypt(key, tweak, input))}